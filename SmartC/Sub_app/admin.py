@@ -7,6 +7,7 @@ import uuid
 from werkzeug.security import generate_password_hash
 import json
 from datetime import datetime
+from face_store import count_persons
 
 import os
 import pickle
@@ -19,6 +20,20 @@ import face_recognition
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
+# Use the root directory's face database (same level as SmartC folder)
+FACE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'face_database.pkl')
+FACE_STORE_DIR = os.path.splitext(FACE_DB_PATH)[0] + '_store'
+
+
+def count_registered_faces():
+    """Count registered persons across all sections, or None if there is no face database.
+
+    Reads the embedding store's index.json (or the legacy pickle if it has not
+    been migrated yet) plus the registration journal, so faces registered since
+    the last compaction are counted; no embeddings are loaded.
+    """
+    return count_persons(FACE_STORE_DIR, FACE_DB_PATH)
+
 # -----------------------------
 # Admin Dashboard
 # -----------------------------
@@ -33,21 +48,13 @@ def admin_dashboard():
     total_students = Student.query.count()
     total_teachers = Teacher.query.count()
     
-    # Count registered faces from face_database.pkl (same as face_list page)
+    # Count registered faces from the face database (same as face_list page)
     total_face_encodings = 0
-    # Use the root directory's face_database.pkl (same level as SmartC folder)
-    face_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'face_database.pkl')
-    
-    if os.path.exists(face_db_path):
-        try:
-            with open(face_db_path, 'rb') as f:
-                face_database = pickle.load(f)
-                # Count total persons across all sections
-                for section_name, section_data in face_database.get('sections', {}).items():
-                    total_face_encodings += len(section_data)
-        except Exception as e:
-            print(f"Error loading face database: {e}")
-            total_face_encodings = 0
+    try:
+        total_face_encodings = count_registered_faces() or 0
+    except Exception as e:
+        print(f"Error loading face database: {e}")
+        total_face_encodings = 0
     
     # Get or create system settings
     system_settings = SystemSettings.query.first()
@@ -840,28 +847,18 @@ def dashboard_stats():
         
         # Count registered faces from face database (like face_list page)
         total_faces = 0
-        # Use the root directory's face_database.pkl (same level as SmartC folder)
-        face_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'face_database.pkl')
         
-        print(f"[DEBUG] Looking for face database at: {face_db_path}")
-        print(f"[DEBUG] File exists: {os.path.exists(face_db_path)}")
+        print(f"[DEBUG] Looking for face database at: {FACE_STORE_DIR} / {FACE_DB_PATH}")
         
-        if os.path.exists(face_db_path):
-            try:
-                with open(face_db_path, 'rb') as f:
-                    face_database = pickle.load(f)
-                    # Count total persons across all sections
-                    for section_name, section_data in face_database.get('sections', {}).items():
-                        total_faces += len(section_data)
-                    print(f"[DEBUG] Total faces counted from face database: {total_faces}")
-            except Exception as e:
-                print(f"Error loading face database: {e}")
-                # Fallback to counting from database records
-                teachers_with_faces = Teacher.query.filter(Teacher.photo.isnot(None)).count()
-                students_with_faces = Student.query.filter(Student.image.isnot(None)).count()
-                total_faces = teachers_with_faces + students_with_faces
-        else:
-            # Fallback if face database doesn't exist
+        try:
+            total_faces = count_registered_faces()
+            print(f"[DEBUG] Total faces counted from face database: {total_faces}")
+        except Exception as e:
+            print(f"Error loading face database: {e}")
+            total_faces = None
+        
+        if total_faces is None:
+            # No face database (or it couldn't be read): count from database records
             teachers_with_faces = Teacher.query.filter(Teacher.photo.isnot(None)).count()
             students_with_faces = Student.query.filter(Student.image.isnot(None)).count()
             total_faces = teachers_with_faces + students_with_faces
@@ -0,0 +1,143 @@
+"""Cache for get_student_analytics results, keyed by filters and data generation.
+
+Every key embeds the current analytics generation, a counter stored in the
+database (see models.py) that is bumped in the same transaction as every
+student, attendance or score write. Any process using the same database
+therefore stops reading an entry the moment a write commits, whichever app
+or worker made it; superseded entries just age out.
+
+The default backend is an in-process LRU. With a redis:// URL the entries
+live in Redis instead, so processes also share the results themselves;
+Redis evicts by its own maxmemory policy (use allkeys-lru) and entries
+also expire after ttl seconds.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LocalCacheBackend:
+    """Size-bounded LRU for a single process."""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def size(self):
+        return len(self.entries)
+
+
+class RedisCacheBackend:
+    """Entries shared by every process using the same Redis."""
+
+    def __init__(self, url, ttl=600, namespace="edutrack:analytics"):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = namespace
+
+    def get(self, key):
+        return self.client.get(f"{self.namespace}:{key}")
+
+    def set(self, key, value):
+        self.client.set(f"{self.namespace}:{key}", value, ex=self.ttl)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f"{self.namespace}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class AnalyticsCache:
+    """get_or_compute() wrapper around a backend, with hit/miss counters.
+
+    generation is a callable returning the current data generation, or None
+    when it can't be read (results are then computed without the cache).
+    Results are stored JSON-encoded and decoded on every hit, so callers
+    may modify what they get back without affecting the cache.
+    """
+
+    def __init__(self, generation, max_entries=128):
+        self.generation = generation
+        self.backend = LocalCacheBackend(max_entries)
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def configure(self, url=None, max_entries=128, ttl=600, enabled=True):
+        """Pick the backend: Redis if url is set (and the client is installed), else in-process."""
+        self.enabled = enabled
+        if url and redis is None:
+            print("⚠️ redis package not installed; analytics cache stays in-process")
+            url = None
+        self.backend = RedisCacheBackend(url, ttl=ttl) if url else LocalCacheBackend(max_entries)
+
+    def get_or_compute(self, filters, compute):
+        if not self.enabled:
+            return compute()
+
+        try:
+            # Read the generation before computing: if a write lands meanwhile,
+            # the result is stored under the old generation and never served
+            generation = self.generation()
+            if generation is None:
+                return compute()
+            key = json.dumps([generation, filters], separators=(",", ":"))
+            cached = self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Analytics cache unavailable: {e}")
+            return compute()
+
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        result = compute()
+        try:
+            self.backend.set(key, json.dumps(result))
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Could not store analytics in cache: {e}")
+        return result
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            "backend": "redis" if isinstance(self.backend, RedisCacheBackend) else "local",
+            "enabled": self.enabled,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors
+        }
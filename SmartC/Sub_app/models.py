@@ -4,7 +4,9 @@ from flask_migrate import Migrate
 from tabulate import tabulate  # pip install tabulate
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, case, insert, select, update, event, inspect as sa_inspect, DDL
+from sqlalchemy.orm import Session
+from .analytics_cache import AnalyticsCache
 import json
 import os
 
@@ -153,6 +155,30 @@ class Score(db.Model):
     date = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# ====================================================
+# ROLLUP TABLES (per-student aggregates, kept up to date on write)
+# ====================================================
+class StudentAttendanceRollup(db.Model):
+    __tablename__ = "student_attendance_rollup"
+
+    student_id = db.Column(db.Integer, db.ForeignKey("student.id"), primary_key=True)
+    present = db.Column(db.Integer, default=0, nullable=False)
+    absent = db.Column(db.Integer, default=0, nullable=False)
+    late = db.Column(db.Integer, default=0, nullable=False)
+    excused = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)  # Every record, whatever its status
+
+
+class StudentSubjectRollup(db.Model):
+    __tablename__ = "student_subject_rollup"
+
+    student_id = db.Column(db.String(50), db.ForeignKey("student.student_id"), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    points_sum = db.Column("sum", db.Integer, default=0, nullable=False)
+    points_count = db.Column("count", db.Integer, default=0, nullable=False)
+    first_score_id = db.Column(db.Integer, nullable=False)  # Keeps subjects in first-entry order
+
+
 # ====================================================
 # PASSWORD RESET TOKEN MODEL
 # ====================================================
@@ -279,12 +305,289 @@ class SystemSettings(db.Model):
         return f"<SystemSettings {self.school_name} - {self.academic_year}>"
 
 
+# ====================================================
+# ROLLUP MAINTENANCE
+# ====================================================
+# Attendance statuses with their own rollup column; others only count toward total
+ATTENDANCE_ROLLUP_COLUMNS = {"Present": "present", "Absent": "absent", "Late": "late", "Excused": "excused"}
+
+
+def _bump_rollup(model, key, deltas, **new_row):
+    """Add deltas to one rollup row in the current transaction, creating the row if needed."""
+    updated = model.query.filter_by(**key).update(
+        {getattr(model, column): getattr(model, column) + delta for column, delta in deltas.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(model(**key, **deltas, **new_row))
+        db.session.flush()
+
+
+def apply_attendance_rollup(student_pk, new_status=None, old_status=None):
+    """Reflect one attendance write in the rollup; call before the commit.
+
+    old_status=None is a new record, new_status=None a deleted one.
+    """
+    deltas = {}
+    for status, sign in ((old_status, -1), (new_status, 1)):
+        if status is None:
+            continue
+        deltas["total"] = deltas.get("total", 0) + sign
+        column = ATTENDANCE_ROLLUP_COLUMNS.get(status)
+        if column:
+            deltas[column] = deltas.get(column, 0) + sign
+
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if deltas:
+        _bump_rollup(StudentAttendanceRollup, {"student_id": student_pk}, deltas)
+
+
+def apply_score_rollup(score):
+    """Add a new Score to its (student, subject) rollup; call before the commit."""
+    if score.id is None:
+        db.session.flush()
+    _bump_rollup(StudentSubjectRollup, {"student_id": score.student_id, "subject": score.subject},
+                 {"points_sum": score.points, "points_count": 1}, first_score_id=score.id)
+
+
+def rebuild_rollups():
+    """Recompute both rollup tables from Attendance and Score (for backfills)."""
+    StudentAttendanceRollup.query.delete()
+    StudentSubjectRollup.query.delete()
+
+    status_counts = [func.sum(case((Attendance.status == status, 1), else_=0))
+                     for status in ATTENDANCE_ROLLUP_COLUMNS]
+    db.session.execute(
+        insert(StudentAttendanceRollup).from_select(
+            [StudentAttendanceRollup.student_id,
+             *(getattr(StudentAttendanceRollup, column) for column in ATTENDANCE_ROLLUP_COLUMNS.values()),
+             StudentAttendanceRollup.total],
+            select(Attendance.student_id, *status_counts, func.count(Attendance.id))
+            .group_by(Attendance.student_id)
+        )
+    )
+    db.session.execute(
+        insert(StudentSubjectRollup).from_select(
+            [StudentSubjectRollup.student_id, StudentSubjectRollup.subject, StudentSubjectRollup.points_sum,
+             StudentSubjectRollup.points_count, StudentSubjectRollup.first_score_id],
+            select(Score.student_id, Score.subject, func.sum(Score.points), func.count(Score.id), func.min(Score.id))
+            .group_by(Score.student_id, Score.subject)
+        )
+    )
+    db.session.commit()
+
+    return {
+        "students": StudentAttendanceRollup.query.count(),
+        "student_subjects": StudentSubjectRollup.query.count()
+    }
+
+
+def _rollups_missing():
+    return ((StudentAttendanceRollup.query.first() is None and Attendance.query.first() is not None) or
+            (StudentSubjectRollup.query.first() is None and Score.query.first() is not None))
+
+
+def ensure_rollups():
+    """Backfill the rollups if they are empty but there is data (e.g. first run after upgrading).
+
+    Every worker calls this at startup, so the check is repeated after taking
+    the write lock on the analytics_generation row: workers that start
+    together wait for the first one's backfill instead of redoing it.
+    """
+    if not _rollups_missing():
+        return None
+    db.session.execute(update(AnalyticsGeneration).where(AnalyticsGeneration.id == 1)
+                       .values(generation=AnalyticsGeneration.generation + 1))
+    if not _rollups_missing():
+        db.session.rollback()
+        return None
+    return rebuild_rollups()
+
+
+# Databases (by URL) whose rollup tables exist and have been filled
+_rollups_ready = set()
+
+
+def rollups_ready():
+    """True once both rollup tables exist and are filled for the current database.
+
+    Until then (an older database opened by a script that never ran
+    ensure_rollups) the analytics aggregate the raw rows instead.
+    """
+    key = str(db.engine.url)
+    if key in _rollups_ready:
+        return True
+    inspector = sa_inspect(db.engine)
+    if not all(inspector.has_table(model.__tablename__) for model in (StudentAttendanceRollup, StudentSubjectRollup)):
+        return False
+    if _rollups_missing():
+        return False
+    _rollups_ready.add(key)
+    return True
+
+
+def student_attendance_counts(student_pks):
+    """{student pk: (total, present, absent, late)} for a list or subquery of Student.id."""
+    if rollups_ready():
+        rollup = StudentAttendanceRollup
+        rows = db.session.query(rollup.student_id, rollup.total, rollup.present, rollup.absent, rollup.late)\
+            .filter(rollup.student_id.in_(student_pks))
+    else:
+        rows = db.session.query(Attendance.student_id, func.count(Attendance.id),
+                                *(func.sum(case((Attendance.status == status, 1), else_=0))
+                                  for status in ("Present", "Absent", "Late")))\
+            .filter(Attendance.student_id.in_(student_pks))\
+            .group_by(Attendance.student_id)
+    return {student_pk: tuple(counts) for student_pk, *counts in rows}
+
+
+def score_aggregate_columns():
+    """(student_id, subject, points sum, points count, first score id) to group scores by.
+
+    Reads the per-(student, subject) rollup once it is ready, the raw scores before.
+    """
+    if rollups_ready():
+        rollup = StudentSubjectRollup
+        return (rollup.student_id, rollup.subject, func.sum(rollup.points_sum),
+                func.sum(rollup.points_count), func.min(rollup.first_score_id))
+    return Score.student_id, Score.subject, func.sum(Score.points), func.count(Score.id), func.min(Score.id)
+
+
+def class_score_stats(class_student_ids, subject=None):
+    """(average points, students averaging under 70) for a class.
+
+    The class is given by Student.student_id codes, the key Score rows carry.
+    The average covers only the subject's scores when one is given; the
+    under-70 count always covers every subject.
+    """
+    student_col, subject_col, sum_col, count_col, _ = score_aggregate_columns()
+    engagement_query = db.session.query(sum_col, count_col).filter(student_col.in_(class_student_ids))
+    if subject:
+        engagement_query = engagement_query.filter(subject_col == subject)
+
+    points_sum, points_count = engagement_query.one()
+    average = round(points_sum / points_count, 2) if points_count else 0
+
+    low_performers = (
+        db.session.query(student_col)
+        .filter(student_col.in_(class_student_ids))
+        .group_by(student_col)
+        .having(sum_col < 70 * count_col)
+        .count()
+    )
+    return average, low_performers
+
+
+# ====================================================
+# ANALYTICS CACHE (keyed by a generation bumped with every write)
+# ====================================================
+class AnalyticsGeneration(db.Model):
+    """Single row counting committed analytics writes; part of every cache key."""
+    __tablename__ = "analytics_generation"
+
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, default=0, nullable=False)
+
+
+# create_all() creates the table together with its one row
+event.listen(AnalyticsGeneration.__table__, "after_create",
+             DDL("INSERT INTO analytics_generation (id, generation) VALUES (1, 0)"))
+
+# Databases (by URL) known to have the analytics_generation table
+_generation_tables = set()
+
+
+def _has_generation_table():
+    key = str(db.engine.url)
+    if key not in _generation_tables:
+        if not sa_inspect(db.engine).has_table(AnalyticsGeneration.__tablename__):
+            return False
+        _generation_tables.add(key)
+    return True
+
+
+def _analytics_generation():
+    """The committed analytics generation, or None on a database without the table yet."""
+    if not _has_generation_table():
+        return None
+    return db.session.query(AnalyticsGeneration.generation).filter_by(id=1).scalar()
+
+
+# The generation lives in the database, so every app and worker process on the
+# same database sees the others' writes, whichever cache backend they use
+analytics_cache = AnalyticsCache(generation=_analytics_generation)
+
+# Models whose writes change get_student_analytics results
+ANALYTICS_MODEL_TABLES = {
+    Student: "student",
+    Attendance: "attendance",
+    Score: "score",
+    StudentAttendanceRollup: "attendance",
+    StudentSubjectRollup: "score",
+}
+
+
+def _note_analytics_writes(session, tables):
+    if not tables:
+        return
+    session.info.setdefault("analytics_tables", set()).update(tables)
+
+    # Bump once per transaction, inside it: the new generation commits (or
+    # rolls back) together with the writes
+    if session.info.get("analytics_bumped") or not _has_generation_table():
+        return
+    session.info["analytics_bumped"] = True
+    table = AnalyticsGeneration.__table__
+    session.connection().execute(
+        table.update().where(table.c.id == 1).values(generation=table.c.generation + 1)
+    )
+
+
+def _has_pending_analytics_writes(session):
+    """Flushed or still-unflushed analytics writes not yet committed in this session."""
+    return bool(session.info.get("analytics_tables")) or any(
+        type(obj) in ANALYTICS_MODEL_TABLES for obj in (*session.new, *session.dirty, *session.deleted)
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _track_analytics_flush(session, flush_context, instances):
+    _note_analytics_writes(session, {
+        ANALYTICS_MODEL_TABLES[type(obj)]
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if type(obj) in ANALYTICS_MODEL_TABLES
+    })
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_analytics_statements(orm_execute_state):
+    # Bulk query.update()/delete() and insert().from_select() bypass the flush
+    if orm_execute_state.is_select:
+        return
+    _note_analytics_writes(orm_execute_state.session, {
+        ANALYTICS_MODEL_TABLES[mapper.class_]
+        for mapper in orm_execute_state.all_mappers
+        if mapper.class_ in ANALYTICS_MODEL_TABLES
+    })
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_analytics_writes(session):
+    session.info.pop("analytics_tables", None)
+    session.info.pop("analytics_bumped", None)
+
+
 # ====================================================
 # ANALYTICS HELPER (UPDATED WITH WEIGHTED SUBJECT SCORES)
 # ====================================================
 def get_student_analytics(grade="", section="", subject="", score_weight=0.7, attendance_weight=0.3):
     """Compute attendance %, average score, and per-subject weighted scores.
     
+    Results are cached per set of arguments until a student, attendance
+    or score write is committed (computed fresh while this session has
+    uncommitted ones).
+    
     Args:
         grade: Filter by grade level
         section: Filter by section
@@ -295,34 +598,72 @@ def get_student_analytics(grade="", section="", subject="", score_weight=0.7, at
     Returns:
         List of student data with calculated metrics
     """
+    if _has_pending_analytics_writes(db.session):
+        # This session sees writes that may still be rolled back: don't cache them
+        return compute_student_analytics(grade, section, subject, score_weight, attendance_weight)
+    return analytics_cache.get_or_compute(
+        [grade, section, subject, score_weight, attendance_weight],
+        lambda: compute_student_analytics(grade, section, subject, score_weight, attendance_weight)
+    )
+
+
+def get_student_analytics_for(student_id, score_weight=0.7, attendance_weight=0.3):
+    """get_student_analytics() entry for one student, or None if not found.
+    
+    Reads only that student's rollup rows (primary-key lookups), so the cost
+    doesn't depend on the size of the school. Not cached.
+    """
+    students_data = compute_student_analytics(score_weight=score_weight, attendance_weight=attendance_weight,
+                                              student_id=student_id)
+    return students_data[0] if students_data else None
+
+
+def compute_student_analytics(grade="", section="", subject="", score_weight=0.7, attendance_weight=0.3,
+                              student_id=None):
+    """get_student_analytics without the cache (student_id limits it to that student)."""
     students_data = []
     
     # Build base query with filters
     query = Student.query
     
+    if student_id:
+        query = query.filter(Student.student_id == student_id)
     if grade:
         query = query.filter(Student.grade_level == grade)
     if section:
         query = query.filter(Student.section == section)
     
     all_students = query.all()
+    if not all_students:
+        return students_data
+
+    # Three queries in total, however many students: the students, their
+    # attendance counts and their score totals per subject (read from the
+    # rollup tables once they are ready)
+    attendance_counts = student_attendance_counts(query.with_entities(Student.id))
+
+    score_stats = {}
+    student_col, subject_col, sum_col, count_col, first_col = score_aggregate_columns()
+    score_query = db.session.query(student_col, subject_col, sum_col, count_col)\
+        .filter(student_col.in_(query.with_entities(Student.student_id)))
+    if subject:
+        score_query = score_query.filter(subject_col == subject)
+    # First-entry order, the order the old per-student DISTINCT returned subjects in
+    score_query = score_query.group_by(student_col, subject_col).having(count_col > 0).order_by(first_col)
+    for student_key, subj, total_points, count in score_query:
+        score_stats.setdefault(student_key, {})[subj] = (total_points / count, total_points, count)
 
     for student in all_students:
         # Attendance calculations
-        attendance_query = Attendance.query.filter_by(student_id=student.id)
-        total_days = attendance_query.count()
-        present_days = attendance_query.filter_by(status="Present").count()
-        absent_count = attendance_query.filter_by(status="Absent").count()
-        late_count = attendance_query.filter_by(status="Late").count()
+        total_days, present_days, absent_count, late_count = attendance_counts.get(student.id, (0, 0, 0, 0))
         attendance_percentage = round((present_days / total_days) * 100, 2) if total_days > 0 else 0
 
         # Score calculations with subject filter
+        student_scores = score_stats.get(student.student_id, {})
         if subject:
             subjects_to_query = [subject]
         else:
-            subjects_to_query = [s.subject for s in db.session.query(Score.subject)
-                                 .filter_by(student_id=student.student_id)
-                                 .distinct()]
+            subjects_to_query = list(student_scores)
         
         subject_score_dict = {}
         raw_subject_scores = {}
@@ -330,27 +671,11 @@ def get_student_analytics(grade="", section="", subject="", score_weight=0.7, at
         subject_counts = {}
         
         for subj in subjects_to_query:
-            # Get all scores for this subject
-            scores_query = db.session.query(Score.points, func.count(Score.points))\
-                .filter_by(student_id=student.student_id, subject=subj)\
-                .group_by(Score.student_id)
+            avg_score, total_score, score_count = student_scores.get(subj, (None, None, None))
             
             # Average score for this subject (raw, without attendance)
-            avg_score = db.session.query(func.avg(Score.points))\
-                .filter_by(student_id=student.student_id, subject=subj)\
-                .scalar()
             avg_score = round(avg_score or 0, 2)
-            
-            # Total sum of scores for this subject
-            total_score = db.session.query(func.sum(Score.points))\
-                .filter_by(student_id=student.student_id, subject=subj)\
-                .scalar()
             total_score = total_score or 0
-            
-            # Count of score entries
-            score_count = db.session.query(func.count(Score.id))\
-                .filter_by(student_id=student.student_id, subject=subj)\
-                .scalar()
             score_count = score_count or 0
 
             # Weighted score using custom weights (for overall calculation)
@@ -393,12 +718,14 @@ def get_student_analytics(grade="", section="", subject="", score_weight=0.7, at
 # ====================================================
 # STUDENT STATUS EVALUATION (System Preferences)
 # ====================================================
-def evaluate_student_status(student_id=None):
+def evaluate_student_status(student_id=None, analytics=None):
     """
     Evaluate student(s) against system preferences.
     
     Args:
         student_id: Specific student ID to evaluate, or None for all students
+        analytics: get_student_analytics() result to evaluate (fetched with
+                   the default weights if None)
     
     Returns:
         Single student evaluation dict if student_id provided, else list of all evaluations
@@ -410,7 +737,8 @@ def evaluate_student_status(student_id=None):
     honor_roll_grade = settings.honor_roll_grade if settings else 90.0
     
     # Get student analytics
-    analytics = get_student_analytics()
+    if analytics is None:
+        analytics = get_student_analytics()
     
     # Filter for specific student if requested
     if student_id:
@@ -508,6 +836,49 @@ def get_student_flags(student_id):
     return []
 
 
+# ====================================================
+# DASHBOARD DATA
+# ====================================================
+def get_dashboard_data(score_weight=0.7, attendance_weight=0.3, today=None):
+    """
+    Everything the teacher dashboard renders, with a fixed number of queries.
+    
+    Analytics are computed once and the status flags are evaluated on that
+    same result; today's attendance for every student is one query.
+    
+    Returns:
+        Dict with raw_student (analytics + flags/status_info), students
+        (Student objects with today's status/is_present) and today
+    """
+    today = today or datetime.now().date()
+    
+    raw_student = get_student_analytics(score_weight=score_weight, attendance_weight=attendance_weight)
+    
+    # evaluate_student_status returns the same dicts under 'student'
+    evaluations = evaluate_student_status(analytics=raw_student)
+    status_by_id = {e['student']['student_id']: e for e in evaluations}
+    for student in raw_student:
+        eval_data = status_by_id.get(student['student_id'])
+        student['flags'] = eval_data['flags'] if eval_data else []
+        student['status_info'] = eval_data['status'] if eval_data else {'overall_status': 'good'}
+    
+    # Today's attendance for all students; first record wins, as with .first()
+    today_status = {}
+    for record in Attendance.query.filter_by(date=today).order_by(Attendance.id):
+        today_status.setdefault(record.student_id, record.status)
+    
+    students = Student.query.all()
+    for s in students:
+        s.status = today_status.get(s.id, "Absent")
+        s.is_present = s.status == "Present"
+    
+    return {
+        "raw_student": raw_student,
+        "students": students,
+        "today": today
+    }
+
+
 # ====================================================
 # RUN (for debugging)
 # ====================================================
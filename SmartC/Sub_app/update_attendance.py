@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from datetime import date
-from .models import db, Student, Attendance
+from .models import db, Student, Attendance, apply_attendance_rollup
 from sqlalchemy.exc import IntegrityError
 
 # ✅ Blueprint for attendance
@@ -44,10 +44,12 @@ def update_attendance():
 
         if record:
             if record.status != status:
+                apply_attendance_rollup(student.id, status, old_status=record.status)
                 record.status = status
         else:
             record = Attendance(student_id=student.id, date=today, status=status)
             db.session.add(record)
+            apply_attendance_rollup(student.id, status)
 
         db.session.commit()
 
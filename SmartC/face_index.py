@@ -0,0 +1,408 @@
+# face_index.py - Approximate nearest-neighbour indexes for large face galleries
+import json
+import os
+
+import numpy as np
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / (norms + 1e-6)
+
+
+class ANNIndex:
+    """Base class: maps gallery keys (section_name, person_id) to integer ids.
+
+    Backends implement _add, _remove, _search, _save and _load. Vectors are
+    L2-normalized so inner product equals cosine similarity.
+    """
+
+    backend = None
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.key_to_id = {}
+        self.id_to_key = {}
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.key_to_id)
+
+    def __contains__(self, key):
+        return tuple(key) in self.key_to_id
+
+    def keys(self):
+        return set(self.key_to_id.keys())
+
+    def add(self, keys, vectors):
+        keys = [tuple(k) for k in keys]
+        if not keys:
+            return
+
+        # Re-adding a key replaces its vector
+        self.remove([k for k in keys if k in self.key_to_id])
+
+        ids = np.arange(self.next_id, self.next_id + len(keys), dtype=np.int64)
+        self.next_id += len(keys)
+        for key, idx in zip(keys, ids):
+            self.key_to_id[key] = int(idx)
+            self.id_to_key[int(idx)] = key
+
+        self._add(ids, _normalize(vectors))
+
+    def remove(self, keys):
+        ids = []
+        for key in keys:
+            idx = self.key_to_id.pop(tuple(key), None)
+            if idx is not None:
+                del self.id_to_key[idx]
+                ids.append(idx)
+        if ids:
+            self._remove(np.asarray(ids, dtype=np.int64))
+
+    def search_batch(self, queries, top_k=1):
+        """Return one list of (key, similarity) per query row, best first."""
+        queries = _normalize(queries)
+        if len(self) == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        ids, sims = self._search(queries, min(top_k, len(self)))
+
+        results = []
+        for row_ids, row_sims in zip(ids, sims):
+            results.append([
+                (self.id_to_key[int(idx)], float(sim))
+                for idx, sim in zip(row_ids, row_sims)
+                if int(idx) in self.id_to_key
+            ])
+        return results
+
+    def save(self, path_prefix):
+        meta = {
+            'backend': self.backend,
+            'dim': self.dim,
+            'next_id': self.next_id,
+            'keys': [[key[0], key[1], idx] for key, idx in self.key_to_id.items()]
+        }
+        self._save(path_prefix)
+        # Write metadata last and atomically so a partial save is never loaded
+        tmp_path = f"{path_prefix}.keys.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, f"{path_prefix}.keys.json")
+
+    @classmethod
+    def load(cls, path_prefix, **kwargs):
+        with open(f"{path_prefix}.keys.json") as f:
+            meta = json.load(f)
+
+        index_cls = INDEX_BACKENDS[meta['backend']]
+        index = index_cls(dim=meta['dim'], **kwargs)
+        index.next_id = meta['next_id']
+        for section_name, person_id, idx in meta['keys']:
+            index.key_to_id[(section_name, person_id)] = idx
+            index.id_to_key[idx] = (section_name, person_id)
+        index._load(path_prefix)
+        return index
+
+    def _add(self, ids, vectors):
+        raise NotImplementedError
+
+    def _remove(self, ids):
+        raise NotImplementedError
+
+    def _search(self, queries, top_k):
+        raise NotImplementedError
+
+    def _save(self, path_prefix):
+        raise NotImplementedError
+
+    def _load(self, path_prefix):
+        raise NotImplementedError
+
+
+class IVFIndex(ANNIndex):
+    """Inverted-file index in pure NumPy.
+
+    Vectors are bucketed by their nearest k-means centroid; a query scans only
+    the nprobe closest buckets. Until min_train_size vectors have been added
+    the index stays a single flat bucket (exact search).
+    """
+
+    backend = 'numpy'
+
+    def __init__(self, dim=512, nlist=None, nprobe=8, min_train_size=1024, kmeans_iters=10):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.list_vectors = [np.zeros((0, dim), dtype=np.float32)]
+        self.list_ids = [np.zeros(0, dtype=np.int64)]
+        self.id_location = {}
+        self.list_sizes = [0]
+
+    @property
+    def is_trained(self):
+        return len(self.centroids) > 0
+
+    def _all_vectors(self):
+        vectors = [v[:n] for v, n in zip(self.list_vectors, self.list_sizes)]
+        ids = [i[:n] for i, n in zip(self.list_ids, self.list_sizes)]
+        return np.vstack(vectors), np.concatenate(ids)
+
+    def train(self):
+        """(Re)cluster every stored vector into nlist buckets with spherical k-means."""
+        vectors, ids = self._all_vectors()
+        n = len(ids)
+        if n == 0:
+            return
+
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        self.centroids = np.ascontiguousarray(centroids)
+        self.list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self.list_ids = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self.list_sizes = [0] * nlist
+        self.id_location = {}
+        self._insert(ids, vectors)
+
+    def _assign(self, vectors):
+        if not self.is_trained:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _insert(self, ids, vectors):
+        assignment = self._assign(vectors)
+        for list_no in np.unique(assignment):
+            mask = assignment == list_no
+            new_vectors = vectors[mask]
+            new_ids = ids[mask]
+            size = self.list_sizes[list_no]
+            needed = size + len(new_ids)
+
+            # Grow bucket storage geometrically so appends are amortized O(1)
+            if needed > len(self.list_ids[list_no]):
+                capacity = max(needed, 2 * len(self.list_ids[list_no]), 16)
+                vec_buf = np.zeros((capacity, self.dim), dtype=np.float32)
+                id_buf = np.zeros(capacity, dtype=np.int64)
+                vec_buf[:size] = self.list_vectors[list_no][:size]
+                id_buf[:size] = self.list_ids[list_no][:size]
+                self.list_vectors[list_no] = vec_buf
+                self.list_ids[list_no] = id_buf
+
+            self.list_vectors[list_no][size:needed] = new_vectors
+            self.list_ids[list_no][size:needed] = new_ids
+            for offset, idx in enumerate(new_ids):
+                self.id_location[int(idx)] = (int(list_no), size + offset)
+            self.list_sizes[list_no] = needed
+
+    def _add(self, ids, vectors):
+        self._insert(ids, vectors)
+        if not self.is_trained and len(self) >= self.min_train_size:
+            self.train()
+
+    def _remove(self, ids):
+        for idx in ids:
+            list_no, pos = self.id_location.pop(int(idx))
+            last = self.list_sizes[list_no] - 1
+            if pos != last:
+                # Swap the last vector into the freed slot
+                moved_id = int(self.list_ids[list_no][last])
+                self.list_vectors[list_no][pos] = self.list_vectors[list_no][last]
+                self.list_ids[list_no][pos] = moved_id
+                self.id_location[moved_id] = (list_no, pos)
+            self.list_sizes[list_no] = last
+
+    def _search(self, queries, top_k):
+        if self.is_trained:
+            nprobe = min(self.nprobe, len(self.centroids))
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        else:
+            probes = np.zeros((len(queries), 1), dtype=np.int64)
+
+        out_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        out_sims = np.full((len(queries), top_k), -1.0, dtype=np.float32)
+
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            lists = [l for l in lists if self.list_sizes[l] > 0]
+            if not lists:
+                continue
+            vectors = np.vstack([self.list_vectors[l][:self.list_sizes[l]] for l in lists])
+            ids = np.concatenate([self.list_ids[l][:self.list_sizes[l]] for l in lists])
+
+            sims = vectors @ query
+            k = min(top_k, len(ids))
+            best = np.argpartition(-sims, k - 1)[:k]
+            best = best[np.argsort(-sims[best], kind='stable')]
+            out_ids[row, :k] = ids[best]
+            out_sims[row, :k] = sims[best]
+
+        return out_ids, out_sims
+
+    def _save(self, path_prefix):
+        vectors, ids = self._all_vectors()
+        with open(f"{path_prefix}.npz.tmp", 'wb') as f:
+            np.savez(f, centroids=self.centroids, vectors=vectors, ids=ids)
+        os.replace(f"{path_prefix}.npz.tmp", f"{path_prefix}.npz")
+
+    def _load(self, path_prefix):
+        data = np.load(f"{path_prefix}.npz")
+        self.centroids = data['centroids'].astype(np.float32)
+        nlist = max(1, len(self.centroids))
+        self.list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self.list_ids = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self.list_sizes = [0] * nlist
+        self.id_location = {}
+        self._insert(data['ids'].astype(np.int64), data['vectors'].astype(np.float32))
+
+
+class FaissIndex(ANNIndex):
+    """faiss inner-product index.
+
+    Starts as an exact flat index and switches to IVFFlat once min_train_size
+    vectors are stored. Both variants support remove_ids, unlike faiss HNSW.
+    """
+
+    backend = 'faiss'
+
+    def __init__(self, dim=512, nlist=None, nprobe=8, min_train_size=1024):
+        super().__init__(dim)
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss is not installed")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.quantizer = None
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    @property
+    def is_trained(self):
+        return self.quantizer is not None
+
+    def train(self):
+        flat = self.index.index
+        vectors = flat.reconstruct_n(0, flat.ntotal)
+        ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(ids))))
+        self.quantizer = faiss.IndexFlatIP(self.dim)
+        ivf = faiss.IndexIVFFlat(self.quantizer, self.dim, min(nlist, len(ids)), faiss.METRIC_INNER_PRODUCT)
+        ivf.train(vectors)
+        ivf.add_with_ids(vectors, ids)
+        ivf.nprobe = self.nprobe
+        self.index = ivf
+
+    def _add(self, ids, vectors):
+        self.index.add_with_ids(vectors, ids)
+        if not self.is_trained and len(self) >= self.min_train_size:
+            self.train()
+
+    def _remove(self, ids):
+        self.index.remove_ids(ids)
+
+    def _search(self, queries, top_k):
+        sims, ids = self.index.search(queries, top_k)
+        return ids, sims
+
+    def _save(self, path_prefix):
+        faiss.write_index(self.index, f"{path_prefix}.faiss.tmp")
+        os.replace(f"{path_prefix}.faiss.tmp", f"{path_prefix}.faiss")
+
+    def _load(self, path_prefix):
+        self.index = faiss.read_index(f"{path_prefix}.faiss")
+        if isinstance(self.index, faiss.IndexIVF):
+            self.quantizer = self.index.quantizer
+            self.index.nprobe = self.nprobe
+
+
+class HNSWIndex(ANNIndex):
+    """hnswlib graph index; deletions are soft (mark_deleted)."""
+
+    backend = 'hnswlib'
+
+    def __init__(self, dim=512, m=16, ef_construction=200, ef_search=64, initial_capacity=1024):
+        super().__init__(dim)
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("hnswlib is not installed")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space='ip', dim=dim)
+        self.index.init_index(max_elements=initial_capacity, ef_construction=ef_construction, M=m)
+        self.index.set_ef(ef_search)
+
+    def _add(self, ids, vectors):
+        needed = self.index.get_current_count() + len(ids)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, ids)
+
+    def _remove(self, ids):
+        for idx in ids:
+            self.index.mark_deleted(int(idx))
+
+    def _search(self, queries, top_k):
+        self.index.set_ef(max(self.ef_search, top_k))
+        ids, distances = self.index.knn_query(queries, k=top_k)
+        # hnswlib's 'ip' space returns 1 - inner product
+        return ids.astype(np.int64), 1.0 - distances
+
+    def _save(self, path_prefix):
+        self.index.save_index(f"{path_prefix}.hnsw.tmp")
+        os.replace(f"{path_prefix}.hnsw.tmp", f"{path_prefix}.hnsw")
+
+    def _load(self, path_prefix):
+        self.index = hnswlib.Index(space='ip', dim=self.dim)
+        self.index.load_index(f"{path_prefix}.hnsw", max_elements=max(len(self), 1024))
+        self.index.set_ef(self.ef_search)
+
+
+INDEX_BACKENDS = {
+    'numpy': IVFIndex,
+    'faiss': FaissIndex,
+    'hnswlib': HNSWIndex
+}
+
+
+def create_index(backend='auto', dim=512, **kwargs):
+    """Create an empty index. 'auto' prefers faiss, then hnswlib, then NumPy IVF."""
+    if backend == 'auto':
+        if FAISS_AVAILABLE:
+            backend = 'faiss'
+        elif HNSWLIB_AVAILABLE:
+            backend = 'hnswlib'
+        else:
+            backend = 'numpy'
+
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown ANN backend '{backend}', expected one of {list(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](dim=dim, **kwargs)
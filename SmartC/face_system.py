@@ -5,25 +5,101 @@ import pickle
 import os
 import time
 import re
+import threading
 from datetime import datetime
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from scipy.optimize import linear_sum_assignment
+from face_index import ANNIndex, create_index
+from face_workers import InferencePool, load_face_model, resolve_inference_profile, run_face_model
+from face_store import (EmbeddingStore, RegistrationJournal, create_section_event,
+                        delete_section_event, register_event)
 import warnings
 warnings.filterwarnings('ignore')
 
-try:
-    import insightface
-    from insightface.app import FaceAnalysis
-    import mediapipe as mp
-except ImportError:
-    print("Installing required packages...")
-    import subprocess
-    subprocess.check_call(['pip', 'install', 'insightface', 'opencv-python', 'mediapipe'])
-    import insightface
-    from insightface.app import FaceAnalysis
-    import mediapipe as mp
+# insightface and MediaPipe take seconds to import; FaceRecognitionSystem
+# imports them on construction (see FaceEngine for doing that off-thread)
+insightface = FaceAnalysis = mp = None
+
+def import_vision_libraries():
+    global insightface, FaceAnalysis, mp
+    if FaceAnalysis is not None:
+        return
+    try:
+        import insightface
+        from insightface.app import FaceAnalysis
+        import mediapipe as mp
+    except ImportError:
+        print("Installing required packages...")
+        import subprocess
+        subprocess.check_call(['pip', 'install', 'insightface', 'opencv-python', 'mediapipe'])
+        import insightface
+        from insightface.app import FaceAnalysis
+        import mediapipe as mp
+
+class BoxKalmanFilter:
+    """Constant-velocity Kalman filter over a bbox as (cx, cy, w, h) + velocities.
+
+    Noise is scaled by the box height, so near and far faces are treated alike.
+    One step is one processed frame of the session.
+    """
+
+    std_position = 1.0 / 20
+    std_velocity = 1.0 / 160
+
+    def __init__(self, bbox):
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+
+        self.x = np.zeros(8)
+        self.x[:4] = self._to_state(bbox)
+        h = self.x[3]
+        std = [2 * self.std_position * h] * 4 + [10 * self.std_velocity * h] * 4
+        self.P = np.diag(np.square(std))
+
+    @staticmethod
+    def _to_state(bbox):
+        x1, y1, x2, y2 = [float(v) for v in bbox[:4]]
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, max(x2 - x1, 1.0), max(y2 - y1, 1.0)])
+
+    @staticmethod
+    def _to_bbox(state):
+        cx, cy, w, h = state[:4]
+        w, h = max(w, 1.0), max(h, 1.0)
+        return [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+
+    def bbox(self):
+        return self._to_bbox(self.x)
+
+    def peek(self):
+        """Where predict() would put the box, without advancing the filter."""
+        return self._to_bbox(self.F @ self.x)
+
+    def predict(self):
+        h = self.x[3]
+        std = [self.std_position * h] * 4 + [self.std_velocity * h] * 4
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + np.diag(np.square(std))
+        return self.bbox()
+
+    def update(self, bbox):
+        z = self._to_state(bbox)
+        R = np.diag(np.square([self.std_position * self.x[3]] * 4))
+        S = self.H @ self.P @ self.H.T + R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        return self.bbox()
+
+    def rescale(self, factor):
+        """Carry the state over to a frame resized by factor."""
+        self.x = self.x * factor
+        self.P = self.P * factor ** 2
+
 
 class FaceTracker:
-    """Tracks faces across frames using Hungarian algorithm for matching."""
+    """Tracks faces across frames using Hungarian assignment on IoU + embedding similarity."""
     
     def __init__(self, max_disappeared=30, iou_threshold=0.5, max_distance=0.6):
         self.next_id = 0
@@ -60,6 +136,7 @@ class FaceTracker:
         self.frame_count += 1
         
         if len(detections) == 0:
+            self._predict_tracks()
             for track_id in list(self.tracks.keys()):
                 self.disappeared[track_id] += 1
                 if self.disappeared[track_id] > self.max_disappeared:
@@ -77,6 +154,8 @@ class FaceTracker:
                 det['track_id'] = track_id  # Assign track_id to detection
             return self._get_current_tracks()
         
+        # Match against where each track should be now, not where it was last seen
+        self._predict_tracks()
         matches = self._match_tracks(detections)
         
         # Assign track_ids to matched detections
@@ -100,46 +179,59 @@ class FaceTracker:
         
         return self._get_current_tracks()
     
+    def _predict_tracks(self):
+        for track in self.tracks.values():
+            track['predicted_bbox'] = track['kf'].predict()
+
+    @staticmethod
+    def iou_matrix(boxes1, boxes2):
+        """Pairwise IoU between two lists of [x1, y1, x2, y2] boxes."""
+        a = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+        b = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+        
+        x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+        y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+        x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+        y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+        
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        area1 = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+        area2 = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        
+        return intersection / (area1[:, None] + area2[None, :] - intersection + 1e-6)
+    
+    @staticmethod
+    def similarity_matrix(embs1, embs2):
+        """Pairwise cosine similarity; 0 wherever either embedding is missing."""
+        similarity = np.zeros((len(embs1), len(embs2)))
+        rows = [i for i, emb in enumerate(embs1) if emb is not None]
+        cols = [j for j, emb in enumerate(embs2) if emb is not None]
+        if rows and cols:
+            a = np.vstack([embs1[i] for i in rows]).astype(np.float64)
+            b = np.vstack([embs2[j] for j in cols]).astype(np.float64)
+            a /= np.linalg.norm(a, axis=1, keepdims=True) + 1e-6
+            b /= np.linalg.norm(b, axis=1, keepdims=True) + 1e-6
+            similarity[np.ix_(rows, cols)] = a @ b.T
+        return similarity
+    
     def _match_tracks(self, detections):
         if not self.tracks or not detections:
             return []
         
-        cost_matrix = np.zeros((len(self.tracks), len(detections)))
         track_ids = list(self.tracks.keys())
+        tracks = [self.tracks[track_id] for track_id in track_ids]
         
-        for i, track_id in enumerate(track_ids):
-            track = self.tracks[track_id]
-            track_bbox = track['bbox']
-            track_emb = track['emb']
-            
-            for j, det in enumerate(detections):
-                iou_score = self.iou(track_bbox, det['bbox'])
-                
-                emb_distance = 1.0
-                if track_emb is not None and det.get('emb') is not None:
-                    emb_distance = self.cosine_distance(track_emb, det['emb'])
-                
-                combined_score = iou_score * 0.7 + (1 - emb_distance) * 0.3
-                cost_matrix[i, j] = combined_score
+        iou_scores = self.iou_matrix([track.get('predicted_bbox', track['bbox']) for track in tracks],
+                                     [det['bbox'] for det in detections])
+        similarity = self.similarity_matrix([track['emb'] for track in tracks],
+                                            [det.get('emb') for det in detections])
+        score_matrix = iou_scores * 0.7 + similarity * 0.3
         
-        matches = []
-        used_detections = set()
+        # Pairs under the threshold may not be matched, so they can't pull the optimum
+        score_matrix[score_matrix <= 0.3] = 0.0
+        rows, cols = linear_sum_assignment(score_matrix, maximize=True)
         
-        for i, track_id in enumerate(track_ids):
-            best_match = -1
-            best_score = -1
-            
-            for j in range(len(detections)):
-                if j not in used_detections and cost_matrix[i, j] > 0.3:
-                    if cost_matrix[i, j] > best_score:
-                        best_score = cost_matrix[i, j]
-                        best_match = j
-            
-            if best_match != -1:
-                matches.append((track_id, best_match))
-                used_detections.add(best_match)
-        
-        return matches
+        return [(track_ids[i], int(j)) for i, j in zip(rows, cols) if score_matrix[i, j] > 0.3]
     
     def _create_track(self, detection):
         track_id = self.next_id
@@ -148,6 +240,8 @@ class FaceTracker:
         self.tracks[track_id] = {
             'track_id': track_id,
             'bbox': detection['bbox'],
+            'measured_bbox': detection['bbox'],
+            'kf': BoxKalmanFilter(detection['bbox']),
             'emb': detection.get('emb'),
             'first_seen': self.frame_count,
             'last_seen': self.frame_count,
@@ -159,6 +253,8 @@ class FaceTracker:
             'id_number': 'N/A',
             'section': 'Unknown',
             'confidence': 0.0,
+            'landmarks': detection.get('landmarks'),
+            'det_score': detection.get('det_score', 0.0),
             'detection_id': detection.get('detection_id', f'det_{self.frame_count}_unknown')
         }
         
@@ -168,18 +264,11 @@ class FaceTracker:
     def _update_track(self, track_id, detection):
         track = self.tracks[track_id]
         
-        alpha = 0.3
-        old_bbox = track['bbox']
-        new_bbox = detection['bbox']
-        
-        smoothed_bbox = [
-            old_bbox[0] * (1 - alpha) + new_bbox[0] * alpha,
-            old_bbox[1] * (1 - alpha) + new_bbox[1] * alpha,
-            old_bbox[2] * (1 - alpha) + new_bbox[2] * alpha,
-            old_bbox[3] * (1 - alpha) + new_bbox[3] * alpha
-        ]
-        
-        track['bbox'] = smoothed_bbox
+        # The filter has already been advanced by _predict_tracks for this frame
+        track['bbox'] = track['kf'].update(detection['bbox'])
+        track['measured_bbox'] = detection['bbox']
+        track['landmarks'] = detection.get('landmarks')
+        track['det_score'] = detection.get('det_score', track.get('det_score', 0.0))
         
         if detection.get('emb') is not None:
             if track['emb'] is None:
@@ -192,6 +281,73 @@ class FaceTracker:
         track['age'] = self.frame_count - track['first_seen']
         self.disappeared[track_id] = 0
     
+    def propagate(self, prev_gray, gray, min_points=6):
+        """Move the tracks seen last frame with sparse optical flow instead of detecting.
+
+        Returns False (and leaves every track untouched) if any of them can't be
+        followed reliably, so the caller should fall back to full detection.
+        Tracks already missing keep coasting on their Kalman prediction, as on
+        a detection frame that doesn't find them.
+        """
+        frame_h, frame_w = gray.shape[:2]
+        shifts = {}
+
+        for track_id, track in self.tracks.items():
+            if self.disappeared[track_id] > 0:
+                continue
+
+            # Flow starts from where the face actually was, not the smoothed box
+            x1, y1, x2, y2 = [int(round(v)) for v in track['measured_bbox']]
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(frame_w, x2), min(frame_h, y2)
+            if x2 - x1 < 8 or y2 - y1 < 8:
+                return False
+
+            points = cv2.goodFeaturesToTrack(prev_gray[y1:y2, x1:x2], maxCorners=40,
+                                             qualityLevel=0.01, minDistance=4)
+            if points is None or len(points) < min_points:
+                return False
+            points = points.astype(np.float32) + np.array([x1, y1], dtype=np.float32)
+
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(
+                prev_gray, gray, points, None, winSize=(21, 21), maxLevel=3
+            )
+            good = status.ravel() == 1
+            if good.sum() < min_points:
+                return False
+
+            shifts[track_id] = np.median((new_points - points).reshape(-1, 2)[good], axis=0)
+
+        self.frame_count += 1
+        for track_id in list(self.tracks):
+            if track_id in shifts:
+                continue
+            self.tracks[track_id]['predicted_bbox'] = self.tracks[track_id]['kf'].predict()
+            self.disappeared[track_id] += 1
+            if self.disappeared[track_id] > self.max_disappeared:
+                self._remove_track(track_id)
+
+        for track_id, (dx, dy) in shifts.items():
+            track = self.tracks[track_id]
+            x1, y1, x2, y2 = track['measured_bbox']
+            track['measured_bbox'] = [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+            # The flow displacement is a measurement like any detection
+            track['predicted_bbox'] = track['kf'].predict()
+            track['bbox'] = track['kf'].update(track['measured_bbox'])
+            if track.get('landmarks') is not None:
+                track['landmarks'] = np.asarray(track['landmarks']) + np.array([dx, dy])
+            track['last_seen'] = self.frame_count
+            track['age'] = self.frame_count - track['first_seen']
+        return True
+
+    def rescale(self, factor):
+        """Move every track into a frame resized by factor, keeping ids and filter state."""
+        for track in self.tracks.values():
+            track['kf'].rescale(factor)
+            for key in ('bbox', 'measured_bbox', 'predicted_bbox', 'landmarks'):
+                if track.get(key) is not None:
+                    track[key] = scale_coordinates(track[key], factor)
+
     def update_track_recognition(self, track_id, recognition_info):
         if track_id in self.tracks:
             track = self.tracks[track_id]
@@ -244,19 +400,30 @@ class FaceTracker:
 
 class HandDetection:
     """Simplified hand detection for reliability"""
+
+    # Largest max_num_hands a personal-zone crop graph is built with; crops
+    # merge at most half as many zones, so each zone keeps two hands
+    MAX_ROI_HANDS = 8
     
     def __init__(self):
         self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
+        self.hands = self.new_tracking_graph()
+        # Still-image graphs for personal-zone crops, keyed by max_num_hands;
+        # callers with a pooled graph pass their own dict instead
+        self.roi_graphs = {}
+        
+    def new_tracking_graph(self):
+        return self.mp_hands.Hands(
             static_image_mode=False,
             max_num_hands=2,
             min_detection_confidence=0.5,  # Lower for better detection
             min_tracking_confidence=0.5
         )
         
-    def detect_hands(self, frame):
+    def detect_hands(self, frame, hands=None):
+        """Detect hands on the full frame, with a session's own graph if given."""
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(rgb_frame)
+        results = (hands or self.hands).process(rgb_frame)
         
         hand_landmarks = []
         if results.multi_hand_landmarks:
@@ -273,6 +440,88 @@ class HandDetection:
         
         return hand_landmarks
     
+    @staticmethod
+    def _area(rect):
+        return max(0, rect[2] - rect[0]) * max(0, rect[3] - rect[1])
+
+    @classmethod
+    def merge_regions(cls, regions, max_count=None):
+        """Union overlapping rectangles when one crop costs no more pixels than two.
+
+        A crop never covers more than max_count regions. Returns
+        [rect, region_count] pairs.
+        """
+        merged = [[list(rect), 1] for rect in regions]
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(merged)):
+                for j in range(i + 1, len(merged)):
+                    if max_count and merged[i][1] + merged[j][1] > max_count:
+                        continue
+                    a, b = merged[i][0], merged[j][0]
+                    union = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    if cls._area(union) <= cls._area(a) + cls._area(b):
+                        merged[i] = [union, merged[i][1] + merged[j][1]]
+                        del merged[j]
+                        changed = True
+                        break
+                if changed:
+                    break
+        return merged
+
+    def _roi_graph(self, max_hands, crop_graphs=None):
+        # Few distinct sizes, so only a handful of graphs ever get built
+        crop_graphs = self.roi_graphs if crop_graphs is None else crop_graphs
+        max_hands = min(self.MAX_ROI_HANDS, 1 << max(1, (max_hands - 1).bit_length()))
+        if max_hands not in crop_graphs:
+            crop_graphs[max_hands] = self.mp_hands.Hands(
+                static_image_mode=True,
+                max_num_hands=max_hands,
+                min_detection_confidence=0.5
+            )
+        return crop_graphs[max_hands]
+
+    @staticmethod
+    def _same_hand(hand1, hand2):
+        xs = [p[0] for p in hand1]
+        ys = [p[1] for p in hand1]
+        span = max(max(xs) - min(xs), max(ys) - min(ys), 1)
+        return np.hypot(hand1[0][0] - hand2[0][0], hand1[0][1] - hand2[0][1]) < 0.2 * span
+
+    def detect_hands_in_regions(self, frame, regions, crop_graphs=None):
+        """Run hand detection on crops of the given [x1, y1, x2, y2] regions only.
+
+        Each crop gets up to two hands per region it covers, so every student's
+        zone is searched instead of the frame-wide max_num_hands=2. Landmarks
+        are returned in frame coordinates, like detect_hands(). crop_graphs is
+        the caller's own {max_num_hands: graph} dict (e.g. a pooled session
+        graph's); without it the shared self.roi_graphs are used.
+        """
+        frame_h, frame_w = frame.shape[:2]
+        hand_landmarks = []
+
+        for (x1, y1, x2, y2), region_count in self.merge_regions(regions, self.MAX_ROI_HANDS // 2):
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(frame_w, int(x2)), min(frame_h, int(y2))
+            if x2 - x1 < 16 or y2 - y1 < 16:
+                continue
+
+            rgb_crop = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)
+            results = self._roi_graph(2 * region_count, crop_graphs).process(rgb_crop)
+            if not results.multi_hand_landmarks:
+                continue
+
+            crop_w, crop_h = x2 - x1, y2 - y1
+            for hand_landmark in results.multi_hand_landmarks:
+                landmarks = [(x1 + int(landmark.x * crop_w), y1 + int(landmark.y * crop_h))
+                             for landmark in hand_landmark.landmark]
+                # A hand on the edge of two crops is found twice
+                if not any(self._same_hand(landmarks, other) for other in hand_landmarks):
+                    hand_landmarks.append(landmarks)
+
+        return hand_landmarks
+
     def is_open_palm_simple(self, hand_landmarks):
         """For testing - always return True"""
        
@@ -326,21 +575,434 @@ class HandDetection:
        
         return True, (wrist_x, wrist_y), is_open
 
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class HandGraphPool:
+    """Tracking-mode MediaPipe Hands graphs checked out per session.
+
+    A session keeps its graph while it is active, so MediaPipe's tracking state
+    only ever sees one camera and sessions can detect hands in parallel. Graphs
+    of idle (or least recently used) sessions are reset and reused. Each entry
+    also carries the session's still-image crop graphs for personal-zone mode.
+    """
+
+    def __init__(self, factory, max_graphs=32, idle_timeout=300.0, max_free=4):
+        self.factory = factory
+        self.max_free = max_free
+        self.free = []
+        self._lock = threading.Lock()
+        self.graphs_created = 0
+        self.graphs_reused = 0
+        self.sessions = SessionRegistry('hand graph', max_sessions=max_graphs, ttl=idle_timeout,
+                                        on_evict=self._recycle)
+
+    def acquire(self, session_id):
+        """The session's graph as {'hands', 'crop_graphs', 'lock'}; hold 'lock' while processing."""
+        return self.sessions.get_or_create(session_id, self._allocate)
+
+    def _allocate(self):
+        with self._lock:
+            if self.free:
+                self.graphs_reused += 1
+                return self.free.pop()
+            self.graphs_created += 1
+        return {'hands': self.factory(), 'crop_graphs': {}, 'lock': threading.Lock()}
+
+    @contextmanager
+    def borrowed(self):
+        """A graph entry for one frame outside any session (reset and recycled after)."""
+        graph = self._allocate()
+        try:
+            with graph['lock']:
+                yield graph
+        finally:
+            self._recycle(None, graph)
+
+    def release(self, session_id):
+        graph = self.sessions.pop(session_id)
+        if graph is not None:
+            self._recycle(session_id, graph)
+
+    def _recycle(self, session_id, graph):
+        # Waits for a frame that is still using the graph
+        with graph['lock']:
+            reset = getattr(graph['hands'], 'reset', None)
+            with self._lock:
+                if reset is not None and len(self.free) < self.max_free:
+                    reset()
+                    self.free.append(graph)
+                    return
+            graph['hands'].close()
+            for crop_graph in graph['crop_graphs'].values():
+                crop_graph.close()
+
+    def sweep(self):
+        return self.sessions.sweep()
+
+    def stats(self):
+        stats = self.sessions.stats()
+        with self._lock:
+            stats.update({
+                'graphs_created': self.graphs_created,
+                'graphs_reused': self.graphs_reused,
+                'free_graphs': len(self.free)
+            })
+        return stats
+
+def scale_coordinates(value, scale):
+    """Scale every number in a (nested) list/tuple of coordinates."""
+    if scale == 1.0:
+        return value
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [scale_coordinates(v, scale) for v in value]
+    if isinstance(value, (int, np.integer)):
+        return int(round(value * scale))
+    return float(value) * scale
+
+
+def image_size(buffer):
+    """(width, height) from a JPEG or PNG header without decoding; None if unknown."""
+    data = memoryview(buffer).cast('B')
+    if len(data) > 24 and bytes(data[:8]) == b'\x89PNG\r\n\x1a\n':
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        # SOFn frames carry the size (C4/C8/CC are not frames)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+class FrameAnalysis:
+    """Everything computed for one frame.
+
+    Hand landmarks are detected lazily and at most once, so the modal check
+    and the API response share a single MediaPipe pass. frame may be a
+    reduced-size decode: frame_scale maps its pixels back to the uploaded
+    frame, which is what faces and hand_landmarks are reported in.
+    """
+
+    def __init__(self, frame, session_id=None, hand_detect_fn=None, frame_scale=1.0):
+        self.frame = frame
+        self.frame_scale = frame_scale
+        self.session_id = session_id
+        self.faces = []
+        self.optimization_stats = {}
+        self.modal_info = None
+        self.dropped_frames = 0
+        self._hand_detect_fn = hand_detect_fn
+        self._hand_landmarks = None
+
+    def detected_hands(self):
+        """Hand landmarks in self.frame pixels."""
+        if self._hand_landmarks is None:
+            self._hand_landmarks = self._hand_detect_fn(self) if self._hand_detect_fn else []
+        return self._hand_landmarks
+
+    @property
+    def hand_landmarks(self):
+        return scale_coordinates(self.detected_hands(), self.frame_scale)
+
+class SessionRegistry:
+    """Per-session state with LRU and idle-time (TTL) eviction.
+
+    Entries idle for longer than ttl seconds are dropped by sweep(); when more
+    than max_sessions are live, the least recently used one is dropped.
+    """
+
+    def __init__(self, name, max_sessions=256, ttl=1800.0, on_evict=None):
+        self.name = name
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # session_id -> (value, last_access)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+
+    def get_or_create(self, session_id, factory):
+        """The session's value, built with factory() if it has none yet.
+
+        factory() runs outside the lock (building a MediaPipe graph is slow and
+        would stall every other session); if another thread adds the session
+        meanwhile, its value is kept and ours is handed to on_evict.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._put_locked(session_id, entry[0])
+                return entry[0]
+
+        value = factory()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                evicted = self._put_locked(session_id, value)
+            else:
+                discarded, value = value, entry[0]
+                evicted = self._put_locked(session_id, value)
+        if entry is not None and self.on_evict:
+            self.on_evict(session_id, discarded)
+        self._notify_evicted(evicted)
+        return value
+
+    def get(self, session_id, default=None):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return default
+            self._entries.move_to_end(session_id)
+            self._entries[session_id] = (entry[0], time.time())
+            return entry[0]
+
+    def set(self, session_id, value):
+        with self._lock:
+            evicted = self._put_locked(session_id, value)
+        self._notify_evicted(evicted)
+
+    def _put_locked(self, session_id, value):
+        if self._entries.pop(session_id, None) is None:
+            self.created += 1
+        self._entries[session_id] = (value, time.time())
+        evicted = []
+        while len(self._entries) > self.max_sessions:
+            evicted.append(self._entries.popitem(last=False))
+            self.evicted_lru += 1
+        return evicted
+
+    def pop(self, session_id, default=None):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        return default if entry is None else entry[0]
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sweep(self, now=None):
+        """Drop entries idle for longer than ttl; returns how many were dropped."""
+        cutoff = (now or time.time()) - self.ttl
+        evicted = []
+        with self._lock:
+            # Oldest access first, so stop at the first entry still in use
+            for session_id, (value, last_access) in list(self._entries.items()):
+                if last_access > cutoff:
+                    break
+                del self._entries[session_id]
+                evicted.append((session_id, (value, last_access)))
+            self.evicted_ttl += len(evicted)
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    def _notify_evicted(self, evicted):
+        for session_id, (value, _) in evicted:
+            print(f"[SESSIONS] Evicted {self.name} for session {session_id}")
+            if self.on_evict:
+                self.on_evict(session_id, value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'live_sessions': len(self._entries),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl,
+                'created': self.created,
+                'evicted_ttl': self.evicted_ttl,
+                'evicted_lru': self.evicted_lru
+            }
+
+class EmbeddingGallery:
+    """Contiguous, pre-normalized float32 matrix of avg_embeddings for fast matching."""
+
+    def __init__(self, matrix=None, entries=None):
+        self.matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        # One (section_name, person_id) pair per matrix row
+        self.entries = entries if entries is not None else []
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / (norms + 1e-6)
+
+    @classmethod
+    def from_section(cls, section_name, section_data):
+        entries = []
+        rows = []
+        for person_id, data in section_data.items():
+            avg_embedding = data.get('avg_embedding')
+            if avg_embedding is not None:
+                entries.append((section_name, person_id))
+                rows.append(avg_embedding)
+
+        if not rows:
+            return cls()
+
+        matrix = np.ascontiguousarray(cls.normalize(np.vstack(rows)))
+        return cls(matrix, entries)
+
+    @classmethod
+    def concatenate(cls, galleries):
+        galleries = [g for g in galleries if len(g) > 0]
+        if not galleries:
+            return cls()
+
+        matrix = np.ascontiguousarray(np.vstack([g.matrix for g in galleries]))
+        entries = [entry for g in galleries for entry in g.entries]
+        return cls(matrix, entries)
+
+    def search(self, embedding):
+        """Return (row_index, similarity) of the best match, or (None, -1.0) if empty."""
+        if len(self) == 0:
+            return None, -1.0
+
+        query = self.normalize(embedding)
+        similarities = self.matrix @ query
+        best_idx = int(np.argmax(similarities))
+        return best_idx, float(similarities[best_idx])
+
+    def search_batch(self, embeddings, top_k=1):
+        """Match an (N x D) block in one matrix multiply.
+
+        Returns (indices, similarities), both (N x k) and sorted best-first,
+        with k = min(top_k, len(self)).
+        """
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        n = embeddings.shape[0]
+        k = min(top_k, len(self))
+        if n == 0 or k == 0:
+            return np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+
+        similarities = self.normalize(embeddings) @ self.matrix.T
+
+        if k == 1:
+            indices = np.argmax(similarities, axis=1)[:, None]
+        else:
+            # argpartition keeps this O(N*M) before sorting only the k candidates
+            candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            candidate_sims = np.take_along_axis(similarities, candidates, axis=1)
+            order = np.argsort(-candidate_sims, axis=1, kind='stable')
+            indices = np.take_along_axis(candidates, order, axis=1)
+
+        return indices, np.take_along_axis(similarities, indices, axis=1)
+
 class FaceRecognitionSystem:
-    def __init__(self, model_name='buffalo_l', db_path='face_database.pkl'):
+    def __init__(self, model_name='buffalo_l', db_path='face_database.pkl', store_dir=None,
+                 ann_backend='auto', ann_min_size=10000, compact_every=100, compaction_interval=300.0,
+                 inference_workers=None, inference_processes=0, detect_interval=1,
+                 max_sessions=256, session_ttl=1800.0, session_sweep_interval=60.0,
+                 hand_roi_mode=False, max_hand_graphs=32, hand_graph_idle=300.0,
+                 det_sizes=((640, 640), (480, 480), (320, 320)), inference_profile=None):
         print("=" * 50)
         print("INITIALIZING FACE RECOGNITION SYSTEM - REVISED TRACKING")
         print("=" * 50)
         
+        import_vision_libraries()
+        
+        # Detector input sizes, largest first; each session uses the smallest one
+        # that still resolves its faces (see _choose_det_size)
+        self.det_sizes = sorted((tuple(size) for size in det_sizes), key=lambda size: size[0] * size[1], reverse=True)
+        self.det_size = self.det_sizes[0]
+        self.min_det_face_px = 32
+        self.min_recognition_face_px = 112
+        self.full_det_every = 15
+
+        # ONNX Runtime threads / graph optimization / warm-up (see face_workers.DEFAULT_INFERENCE_PROFILE)
+        self.inference_profile = resolve_inference_profile(inference_profile)
+
+        self.app = None
+        self.inference_pool = None
         try:
-            self.app = FaceAnalysis(name=model_name, providers=['CPUExecutionProvider'])
-            self.app.prepare(ctx_id=-1, det_size=(640, 640))  # Use CPU
-            print("[INIT] Face detection model loaded successfully")
+            if inference_processes:
+                # One model per worker process; this process only tracks and matches
+                self.inference_pool = InferencePool(inference_processes, model_name=model_name,
+                                                    det_sizes=self.det_sizes, profile=self.inference_profile)
+                self.inference_pool.warm_up()
+                inference_workers = inference_workers or inference_processes
+                print(f"[INIT] Face model loaded in {inference_processes} worker processes")
+            else:
+                self.app = load_face_model(model_name, self.det_sizes, self.inference_profile)
+                print(f"[INIT] Face detection model loaded successfully, sizes {self.det_sizes}")
         except Exception as e:
             print(f"[ERROR] Failed to load face model: {e}")
             raise
         
         self.db_path = db_path
+        # Metadata + memory-mapped embedding blocks; db_path is only read to migrate
+        self.store = EmbeddingStore(store_dir or os.path.splitext(db_path)[0] + '_store')
+
+        # Changes are journaled in O(1) and folded into the store in the background
+        self.journal = RegistrationJournal(self.store.store_dir)
+        self.db_lock = threading.RLock()
+        self.dirty_sections = set()
+        self.compact_every = compact_every
+        self.compaction_interval = compaction_interval
+        self._compaction_lock = threading.Lock()
+        self._compaction_wakeup = threading.Event()
+
+        # Approximate index for unfiltered searches; None disables it
+        self.ann_backend = ann_backend
+        self.ann_min_size = ann_min_size
+        self.ann_index = None
+        self.ann_dirty = False
+        self.ann_index_path = os.path.splitext(db_path)[0] + '_ann'
         self.face_database = {
             'sections': {},
             'section_list': [],
@@ -353,18 +1015,43 @@ class FaceRecognitionSystem:
         self.recognition_cache = {}
         self.cache_timeout = 10.0
         
-        self.session_tracking = {}
-        
+        self.frames_dropped = 0
+        self._frames_dropped_lock = threading.Lock()
+
+        # Trackers and modals per camera session; idle or excess sessions are evicted
+        self.session_tracking = SessionRegistry('tracker', max_sessions=max_sessions, ttl=session_ttl)
+        self.session_sweep_interval = session_sweep_interval
+
+        # detect_interval > 1: full detection + embedding only every N frames of a
+        # session; frames in between move the known tracks with optical flow
+        self.detect_interval = max(1, int(detect_interval))
+
+        # Concurrency: sessions run in parallel, each serialized by its own lock;
+        # the gallery is read-mostly; at most inference_workers frames are in the model
+        self.gallery_lock = ReadWriteLock()
+        self.inference_workers = inference_workers or os.cpu_count() or 1
+        self.inference_slots = threading.BoundedSemaphore(self.inference_workers)
+        # Shared hand graph for callers without a session graph; sessions use their own
+        self.hand_lock = threading.Lock()
+
+        # Pre-normalized embedding matrices, rebuilt whenever the database changes
+        self.section_galleries = {}
+        self.global_gallery = EmbeddingGallery()
+
         # Initialize hand detection
         try:
             self.hand_detector = HandDetection()
+            self.hand_graphs = HandGraphPool(self.hand_detector.new_tracking_graph,
+                                             max_graphs=max_hand_graphs, idle_timeout=hand_graph_idle)
             self.hand_detection_enabled = True
             print("[INIT] Hand detection initialized SUCCESSFULLY")
         except Exception as e:
             print(f"[ERROR] Hand detection failed: {e}")
             self.hand_detection_enabled = False
         
-        self.active_modals = {}
+        # hand_roi_mode: look for hands only inside the detected faces' personal zones
+        self.hand_roi_mode = hand_roi_mode
+        self.active_modals = SessionRegistry('modal', max_sessions=max_sessions, ttl=session_ttl)
         self.modal_cooldown = 10.0  # Shorter for testing
         
         self.hand_raise_state = {}
@@ -372,12 +1059,26 @@ class FaceRecognitionSystem:
         
         self.load_database()
         self.active_registrations = {}
+
+        threading.Thread(target=self._compaction_loop, name='face-db-compaction', daemon=True).start()
+        threading.Thread(target=self._session_sweep_loop, name='face-session-sweeper', daemon=True).start()
         
         print("[INIT] System ready! Improved tracking active.")
         print("=" * 50)
     
     def load_database(self):
-        if os.path.exists(self.db_path):
+        if self.store.exists():
+            try:
+                self.face_database = self.store.load()
+                print(f"[DB] Loaded {len(self.face_database['sections'])} sections from {self.store.store_dir}")
+            except Exception as e:
+                print(f"[DB ERROR] {e}")
+                self.face_database = {
+                    'sections': {},
+                    'section_list': [],
+                    'id_map': {}
+                }
+        elif os.path.exists(self.db_path):
             try:
                 with open(self.db_path, 'rb') as f:
                     self.face_database = pickle.load(f)
@@ -387,6 +1088,10 @@ class FaceRecognitionSystem:
                 if 'id_map' not in self.face_database:
                     self.face_database['id_map'] = {}
                     self._rebuild_id_map()
+
+                # One-shot migration of the legacy pickle into the embedding store
+                self.store.save(self.face_database)
+                print(f"[DB] Migrated {self.db_path} to {self.store.store_dir}")
             except Exception as e:
                 print(f"[DB ERROR] {e}")
                 self.face_database = {
@@ -401,7 +1106,89 @@ class FaceRecognitionSystem:
                 'section_list': [],
                 'id_map': {}
             }
-    
+
+        replayed = self.journal.replay(self.face_database)
+        if replayed:
+            self.dirty_sections.update(event['section'] for event in replayed)
+            self._compaction_wakeup.set()
+            print(f"[DB] Replayed {len(replayed)} journaled change(s)")
+
+        self._rebuild_galleries()
+        self._load_ann_index()
+
+    def _rebuild_galleries(self):
+        self.section_galleries = {
+            section_name: EmbeddingGallery.from_section(section_name, section_data)
+            for section_name, section_data in self.face_database['sections'].items()
+        }
+        self._rebuild_global_gallery()
+        print(f"[GALLERY] Built {len(self.section_galleries)} section galleries, {len(self.global_gallery)} embeddings total")
+
+    def _rebuild_section_gallery(self, section_name):
+        if section_name in self.face_database['sections']:
+            self.section_galleries[section_name] = EmbeddingGallery.from_section(
+                section_name, self.face_database['sections'][section_name]
+            )
+        else:
+            self.section_galleries.pop(section_name, None)
+        self._rebuild_global_gallery()
+
+    def _rebuild_global_gallery(self):
+        self.global_gallery = EmbeddingGallery.concatenate(
+            [self.section_galleries[name] for name in self.face_database['section_list']
+             if name in self.section_galleries]
+        )
+
+    def _load_ann_index(self):
+        self.ann_index = None
+        if self.ann_backend is None or len(self.global_gallery) < self.ann_min_size:
+            return
+
+        expected_keys = set(self.global_gallery.entries)
+        if os.path.exists(f"{self.ann_index_path}.keys.json"):
+            try:
+                index = ANNIndex.load(self.ann_index_path)
+                if index.keys() == expected_keys:
+                    self.ann_index = index
+                    print(f"[ANN] Loaded {index.backend} index with {len(index)} entries")
+                    return
+                print("[ANN] Stored index is out of date, rebuilding")
+            except Exception as e:
+                print(f"[ANN ERROR] Failed to load index: {e}")
+
+        self._build_ann_index()
+
+    def _build_ann_index(self):
+        index = create_index(self.ann_backend, dim=self.global_gallery.matrix.shape[1])
+        index.add(self.global_gallery.entries, self.global_gallery.matrix)
+        self.ann_index = index
+        print(f"[ANN] Built {index.backend} index with {len(index)} entries")
+        self._save_ann_index()
+
+    def _save_ann_index(self):
+        try:
+            self.ann_index.save(self.ann_index_path)
+        except Exception as e:
+            print(f"[ANN ERROR] Save failed: {e}")
+
+    def _update_ann_index(self, added=(), removed=()):
+        if self.ann_backend is None:
+            return
+
+        if self.ann_index is None:
+            # Only switch to approximate search once the gallery is large enough
+            if len(self.global_gallery) >= self.ann_min_size:
+                self._build_ann_index()
+            return
+
+        if removed:
+            self.ann_index.remove(removed)
+        if added:
+            vectors = [self.face_database['sections'][sec][pid]['avg_embedding'] for sec, pid in added]
+            self.ann_index.add(added, np.vstack(vectors))
+        # Persisted by the next compaction so writers don't hold the gallery lock for I/O
+        self.ann_dirty = True
+
     def _rebuild_id_map(self):
         self.face_database['id_map'] = {}
         for section_name, section_data in self.face_database['sections'].items():
@@ -413,25 +1200,72 @@ class FaceRecognitionSystem:
                         'person_id': person_id
                     }
     
+    def _journal_change(self, event):
+        with self.db_lock:
+            self.journal.append(event)
+            self.dirty_sections.add(event['section'])
+            if self.journal.pending >= self.compact_every:
+                self._compaction_wakeup.set()
+
     def save_database(self):
-        try:
-            with open(self.db_path, 'wb') as f:
-                pickle.dump(self.face_database, f)
-            return True
-        except Exception as e:
-            print(f"[DB ERROR] Save failed: {e}")
-            return False
+        """Fold journaled changes into the store snapshot now."""
+        return self.compact_database()
+
+    def compact_database(self):
+        with self._compaction_lock:
+            with self.db_lock:
+                if not self.dirty_sections and not self.journal.has_pending():
+                    return True
+                dirty = self.dirty_sections
+                self.dirty_sections = set()
+                # Copy only what the writer reads; clean sections just need their names
+                snapshot = {
+                    'sections': {name: dict(data) if name in dirty else data
+                                 for name, data in self.face_database['sections'].items()},
+                    'section_list': list(self.face_database['section_list'])
+                }
+                self.journal.rotate()
+
+            try:
+                self.store.save(snapshot, changed_sections=dirty)
+                self.journal.finish_compaction()
+                if self.ann_dirty and self.ann_index is not None:
+                    with self.gallery_lock.read():
+                        self.ann_dirty = False
+                        self._save_ann_index()
+                print(f"[DB] Compacted {len(dirty)} section(s) into {self.store.store_dir}")
+                return True
+            except Exception as e:
+                print(f"[DB ERROR] Compaction failed: {e}")
+                with self.db_lock:
+                    self.dirty_sections |= dirty
+                return False
+
+    def _compaction_loop(self):
+        while True:
+            self._compaction_wakeup.wait(self.compaction_interval)
+            self._compaction_wakeup.clear()
+            try:
+                self.compact_database()
+            except Exception as e:
+                print(f"[DB ERROR] Background compaction: {e}")
     
     def create_section(self, section_name):
-        if section_name not in self.face_database['sections']:
-            self.face_database['sections'][section_name] = {}
-            self.face_database['section_list'] = list(self.face_database['sections'].keys())
-            self.save_database()
-            return {'success': True, 'message': f'Section "{section_name}" created successfully'}
-        else:
-            return {'success': False, 'message': f'Section "{section_name}" already exists'}
+        with self.gallery_lock.write():
+            if section_name not in self.face_database['sections']:
+                with self.db_lock:
+                    self.face_database['sections'][section_name] = {}
+                    self.face_database['section_list'] = list(self.face_database['sections'].keys())
+                    self._journal_change(create_section_event(section_name))
+                return {'success': True, 'message': f'Section "{section_name}" created successfully'}
+            else:
+                return {'success': False, 'message': f'Section "{section_name}" already exists'}
     
     def get_all_sections(self):
+        with self.gallery_lock.read():
+            return self._get_all_sections()
+
+    def _get_all_sections(self):
         sections = []
         for section_name in self.face_database['section_list']:
             section_data = self.face_database['sections'][section_name]
@@ -442,17 +1276,19 @@ class FaceRecognitionSystem:
             })
         return sections
     
-    def detect_faces(self, frame):
-        print(f"[FACE DETECT] Processing frame {frame.shape}")
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        faces = self.app.get(rgb_frame)
+    def detect_faces(self, frame, det_size=None):
+        det_size = tuple(det_size or self.det_size)
+        print(f"[FACE DETECT] Processing frame {frame.shape} at {det_size}")
+        with self.inference_slots:
+            if self.inference_pool is not None:
+                faces = self.inference_pool.detect(frame, det_size)
+            else:
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                faces = run_face_model(self.app, rgb_frame, det_size)
         
         results = []
-        for face in faces:
-            bbox = face.bbox.astype(int)
-            landmarks = face.kps
-            embedding = face.normed_embedding
-            detection_score = face.det_score
+        for bbox, landmarks, embedding, detection_score in faces:
+            bbox = bbox.astype(int)
             
             if detection_score > 0.3:  # Lower threshold
                 results.append({
@@ -465,7 +1301,7 @@ class FaceRecognitionSystem:
         print(f"[FACE DETECT] Found {len(results)} face(s)")
         return results
     
-    def _calculate_personal_zone(self, face_bbox, frame_shape):
+    def _calculate_personal_zone(self, face_bbox, frame_shape, frame_scale=1.0):
         frame_h, frame_w = frame_shape[:2]
         face_x1, face_y1, face_x2, face_y2 = face_bbox
         face_width = face_x2 - face_x1
@@ -473,8 +1309,9 @@ class FaceRecognitionSystem:
         
         # Distance-adaptive zone (matches frontend visualization)
         # Smaller faces = farther away = larger zone multiplier
+        # (measured in uploaded-frame pixels, whatever size it was decoded at)
         normal_face_width = 150  # Typical face width at normal distance
-        distance_factor = max(1.0, min(2.5, normal_face_width / face_width))
+        distance_factor = max(1.0, min(2.5, normal_face_width / (face_width * frame_scale)))
         
         # Apply distance-adaptive multipliers (same as frontend)
         height_multiplier = 3.5 * distance_factor  # Ranges from 3.5x to 8.75x
@@ -488,7 +1325,7 @@ class FaceRecognitionSystem:
         print(f"[ZONE] Face: {face_bbox}, Distance: {distance_factor:.2f}x, Zone: [{zone_left}, {zone_top}, {zone_right}, {zone_bottom}]")
         return [int(zone_left), int(zone_top), int(zone_right), int(zone_bottom)]
     
-    def detect_hands_and_check_modal(self, frame, faces, session_id):
+    def detect_hands_and_check_modal(self, frame, faces, session_id, hand_landmarks=None, frame_scale=1.0):
         """SIMPLIFIED WORKING VERSION - Triggers modal when hand detected"""
         print("\n" + "="*50)
         print(f"[MODAL CHECK] Session: {session_id}, Faces: {len(faces)}")
@@ -497,9 +1334,11 @@ class FaceRecognitionSystem:
         if not self.hand_detection_enabled or not session_id:
             return None
         
-        # Detect hands
-        print("[MODAL] Detecting hands...")
-        hand_landmarks = self.hand_detector.detect_hands(frame)
+        # Detect hands, unless the caller already has them for this frame
+        if hand_landmarks is None:
+            print("[MODAL] Detecting hands...")
+            with self.hand_lock:
+                hand_landmarks = self.hand_detector.detect_hands(frame)
         
         if not hand_landmarks:
             print("[MODAL] No hands detected")
@@ -511,7 +1350,7 @@ class FaceRecognitionSystem:
         for face_idx, face in enumerate(faces):
             # Get track_id from face
             track_id = face.get('track_id')
-            if not track_id:
+            if track_id is None:
                 # Create a simple track_id based on face position
                 bbox = face.get('bbox', [0, 0, 100, 100])
                 track_id = f"track_{bbox[0]}_{bbox[1]}_{face_idx}"
@@ -521,7 +1360,7 @@ class FaceRecognitionSystem:
             
             # Calculate personal zone
             face_bbox = face.get('bbox', [0, 0, 100, 100])
-            personal_zone = self._calculate_personal_zone(face_bbox, frame.shape)
+            personal_zone = self._calculate_personal_zone(face_bbox, frame.shape, frame_scale)
             
             # Check each hand
             for hand_idx, hand in enumerate(hand_landmarks):
@@ -568,6 +1407,7 @@ class FaceRecognitionSystem:
                             }
                         }
                         
+                        self.active_modals.set(session_id, modal_info)
                         print(f"[MODAL] ✓✓✓ TRIGGERING MODAL!")
                         print(f"[MODAL] For person: {face.get('name')}")
                         
@@ -577,40 +1417,254 @@ class FaceRecognitionSystem:
         return None
     
     def close_modal(self, session_id, track_id):
-        if (session_id in self.active_modals and 
-            self.active_modals[session_id].get('track_id') == track_id):
-            del self.active_modals[session_id]
+        modal = self.active_modals.get(session_id)
+        if modal is not None and modal.get('track_id') == track_id:
+            self.active_modals.pop(session_id)
             return {'success': True, 'message': 'Modal closed'}
         return {'success': False, 'message': 'No active modal found for this track'}
     
     def recognize_faces_with_tracking(self, frame, section_name=None, session_id=None):
+        analysis = self.analyze_frame(frame, section_name, session_id)
+        return analysis.faces, analysis.optimization_stats
+
+    def analyze_frame(self, frame, section_name=None, session_id=None, frame_scale=1.0):
+        """Recognize, track and check for modals; returns a FrameAnalysis.
+
+        Read analysis.hand_landmarks afterwards to get the hands the modal
+        check already found instead of running detection again. frame_scale
+        is the factor decode_frame() reduced the upload by.
+
+        Without a session_id the frame gets a throwaway tracker and no modal
+        check; nothing is registered, so anonymous requests can't evict the
+        state of real sessions.
+        """
         print(f"\n[RECOGNITION] Starting recognition, session: {session_id}")
         
-        # Ensure we have a session_id for tracking
+        analysis = FrameAnalysis(frame, session_id or None,
+                                 self._detect_frame_hands if self.hand_detection_enabled else None,
+                                 frame_scale=frame_scale)
+        tracker_data = self._get_session(session_id) if session_id else self._new_session(None)
+
+        # Frames of one session must run in order; other sessions proceed in parallel
+        with tracker_data['lock']:
+            results, analysis.optimization_stats = self._recognize_in_session(
+                analysis, section_name, session_id, tracker_data
+            )
+        # Tracking runs in decoded pixels; report in the uploaded frame's pixels
+        analysis.faces = [self._scale_result(result, frame_scale) for result in results]
+        return analysis
+
+    @staticmethod
+    def _scale_result(result, scale):
+        if scale == 1.0:
+            return result
+        result = dict(result)
+        result['bbox'] = scale_coordinates(result['bbox'], scale)
+        result['landmarks'] = scale_coordinates(result['landmarks'], scale)
+        if result.get('modal_info'):
+            modal_info = dict(result['modal_info'])
+            modal_info['zone_coordinates'] = scale_coordinates(modal_info['zone_coordinates'], scale)
+            modal_info['face_bbox'] = scale_coordinates(modal_info['face_bbox'], scale)
+            result['modal_info'] = modal_info
+        return result
+
+    def decode_frame(self, buffer, session_id=None):
+        """cv2.imdecode an uploaded image, at 1/2 or 1/4 size when that loses nothing.
+
+        A reduced decode is used only if its long side still covers the
+        largest detector size and the session's smallest recent face keeps
+        at least min_recognition_face_px. Returns (frame, frame_scale), or
+        (None, 1.0) if the image can't be decoded.
+        """
+        buffer = np.frombuffer(buffer, np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+        size = image_size(buffer)
+        tracker_data = self.session_tracking.get(session_id) if session_id else None
+
+        if size and tracker_data and tracker_data['face_sizes']:
+            smallest_face = min(tracker_data['face_sizes'])
+            for factor, flag in ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if (max(size) / factor >= max(self.det_size) and
+                        smallest_face / factor >= self.min_recognition_face_px):
+                    frame = cv2.imdecode(buffer, flag)
+                    if frame is not None:
+                        return frame, max(size) / max(frame.shape[:2])
+
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1.0
+
+    def _choose_det_size(self, tracker_data, frame_long_side):
+        """Smallest detector size at which the session's faces stay detectable.
+
+        Face sizes are in uploaded-frame pixels, so are compared with the
+        uploaded frame's long side. Every full_det_every detections, and
+        whenever a frame had no faces, the largest size runs again to catch
+        new or distant faces.
+        """
+        if (len(self.det_sizes) == 1 or not tracker_data['face_sizes'] or
+                tracker_data['detections_since_full'] >= self.full_det_every):
+            return self.det_size
+
+        smallest_face = min(tracker_data['face_sizes'])
+        for size in reversed(self.det_sizes):
+            if smallest_face * max(size) / frame_long_side >= self.min_det_face_px:
+                return size
+        return self.det_size
+
+    def analyze_latest_frame(self, frame, section_name=None, session_id=None, frame_scale=1.0):
+        """analyze_frame() behind a one-frame slot per session.
+
+        While a frame of the session is being processed only the newest one
+        waits; a caller whose frame is superseded gets None back right away,
+        so latency stays bounded when frames arrive faster than they finish.
+        """
         if not session_id:
-            session_id = f"session_{int(time.time())}_{hash(frame.tobytes()) % 10000}"
-            print(f"[TRACKING] Generated session_id: {session_id}")
-        
-        if session_id not in self.session_tracking:
-            self.session_tracking[session_id] = {
-                'tracker': FaceTracker(max_disappeared=30, iou_threshold=0.4, max_distance=0.5),
-                'last_cleanup': time.time(),
-                'recognized_tracks': {},
-                'frame_counter': 0  # Add frame counter for better ID generation
-            }
+            return self.analyze_frame(frame, section_name, session_id, frame_scale)
+
+        slot = self._get_session(session_id)['slot']
+        ticket = object()
+        with slot['cond']:
+            if slot['waiting'] is not None:
+                slot['dropped'] += 1
+                with self._frames_dropped_lock:
+                    self.frames_dropped += 1
+            slot['waiting'] = ticket
+            slot['cond'].notify_all()
+            while slot['busy'] and slot['waiting'] is ticket:
+                slot['cond'].wait()
+            if slot['waiting'] is not ticket:
+                print(f"[FRAMES] Dropped a stale frame for session {session_id}")
+                return None
+            slot['waiting'] = None
+            slot['busy'] = True
+
+        try:
+            analysis = self.analyze_frame(frame, section_name, session_id, frame_scale)
+            analysis.dropped_frames = slot['dropped']
+            return analysis
+        finally:
+            with slot['cond']:
+                slot['busy'] = False
+                slot['cond'].notify_all()
+
+    def _detect_frame_hands(self, analysis):
+        # The session's own pooled graphs (borrowed ones for anonymous frames),
+        # so sessions detect hands in parallel without a global lock
+        if analysis.session_id is None:
+            with self.hand_graphs.borrowed() as graph:
+                return self._detect_hands_with(graph, analysis)
+        graph = self.hand_graphs.acquire(analysis.session_id)
+        with graph['lock']:
+            return self._detect_hands_with(graph, analysis)
+
+    def _detect_hands_with(self, graph, analysis):
+        if self.hand_roi_mode:
+            zones = [self._calculate_personal_zone(face['bbox'], analysis.frame.shape, analysis.frame_scale)
+                     for face in analysis.faces]
+            return self.hand_detector.detect_hands_in_regions(analysis.frame, zones, graph['crop_graphs'])
+        return self.hand_detector.detect_hands(analysis.frame, graph['hands'])
+
+    def _get_session(self, session_id):
+        return self.session_tracking.get_or_create(session_id, lambda: self._new_session(session_id))
+
+    def _new_session(self, session_id):
+        if session_id:
             print(f"[TRACKING] Created new tracker for session {session_id}")
-        
-        tracker_data = self.session_tracking[session_id]
+        return {
+            'tracker': FaceTracker(max_disappeared=30, iou_threshold=0.4, max_distance=0.5),
+            'last_cleanup': time.time(),
+            'recognized_tracks': {},
+            'frame_counter': 0,  # Add frame counter for better ID generation
+            'frames_since_detection': 0,
+            'prev_gray': None,
+            # Decode scale the tracker's boxes are in; see _follow_frame_scale
+            'frame_scale': 1.0,
+            # Smallest face per recent detection, in uploaded-frame pixels
+            'face_sizes': deque(maxlen=10),
+            'detections_since_full': 0,
+            'lock': threading.Lock(),
+            # One frame in progress plus at most one waiting; see analyze_latest_frame
+            'slot': {'cond': threading.Condition(), 'busy': False, 'waiting': None, 'dropped': 0}
+        }
+
+    def _session_sweep_loop(self):
+        while True:
+            time.sleep(self.session_sweep_interval)
+            try:
+                self.sweep_sessions()
+            except Exception as e:
+                print(f"[SESSIONS ERROR] Background sweep: {e}")
+
+    def sweep_sessions(self):
+        """Evict sessions idle for longer than session_ttl."""
+        evicted = self.session_tracking.sweep() + self.active_modals.sweep()
+        if self.hand_detection_enabled:
+            evicted += self.hand_graphs.sweep()
+        if evicted:
+            print(f"[SESSIONS] Swept {evicted} idle entries, {len(self.session_tracking)} sessions live")
+        return evicted
+
+    def get_session_stats(self):
+        stats = {
+            'tracking': self.session_tracking.stats(),
+            'modals': self.active_modals.stats(),
+            'frames_dropped': self.frames_dropped
+        }
+        if self.hand_detection_enabled:
+            stats['hand_graphs'] = self.hand_graphs.stats()
+        return stats
+
+    @staticmethod
+    def _follow_frame_scale(tracker_data, frame_scale):
+        """Rescale the session's tracks when decode_frame() picked a different scale.
+
+        Tracking runs in decoded pixels, which change by 2x or 4x whenever the
+        decode scale does; without this no stored track would match again.
+        """
+        if frame_scale != tracker_data['frame_scale']:
+            tracker_data['tracker'].rescale(tracker_data['frame_scale'] / frame_scale)
+            tracker_data['frame_scale'] = frame_scale
+
+    def _recognize_in_session(self, analysis, section_name, session_id, tracker_data):
+        frame = analysis.frame
         tracker = tracker_data['tracker']
         recognized_tracks = tracker_data['recognized_tracks']
         tracker_data['frame_counter'] += 1
+        self._follow_frame_scale(tracker_data, analysis.frame_scale)
+
+        gray = None
+        if self.detect_interval > 1:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if self._propagate_tracks(tracker_data, gray):
+                tracker_data['prev_gray'] = gray
+                tracker_data['frames_since_detection'] += 1
+                results, optimization_stats = self._propagated_results(tracker_data)
+                print(f"[TRACKING] Detection skipped, propagated {len(results)} track(s)")
+                return self._finish_recognition(analysis, results, optimization_stats, session_id)
+
+        tracker_data['frames_since_detection'] = 0
+        tracker_data['prev_gray'] = gray
         
         # Detect faces
-        faces = self.detect_faces(frame)
+        det_size = self._choose_det_size(tracker_data, max(frame.shape[:2]) * analysis.frame_scale)
+        faces = self.detect_faces(frame, det_size)
+        
+        if det_size == self.det_size:
+            tracker_data['detections_since_full'] = 0
+        else:
+            tracker_data['detections_since_full'] += 1
+        if faces:
+            tracker_data['face_sizes'].append(analysis.frame_scale * min(
+                min(face['bbox'][2] - face['bbox'][0], face['bbox'][3] - face['bbox'][1]) for face in faces
+            ))
+        else:
+            # Maybe the smaller size missed them; go back to full size
+            tracker_data['face_sizes'].clear()
         
         if not faces:
             print("[RECOGNITION] No faces detected")
-            return [], {'total_faces': 0, 'recognized_count': 0, 'cached_count': 0, 'optimization_rate': 100}
+            # Nothing was matched this frame, so there is nothing to propagate from
+            tracker_data['prev_gray'] = None
+            return [], {'total_faces': 0, 'recognized_count': 0, 'cached_count': 0, 'optimization_rate': 100,
+                        'detection_skipped': False}
         
         # Prepare detections with better track ID assignment
         detections = []
@@ -620,49 +1674,33 @@ class FaceRecognitionSystem:
                 'bbox': face['bbox'],
                 'emb': face['embedding'],
                 'det_score': face['det_score'],
+                'landmarks': face['landmarks'],
                 'frame_idx': tracker_data['frame_counter'],  # Add frame index
                 'face_idx': idx  # Add face index in current frame
             }
             detections.append(detection)
             face_embeddings.append(face['embedding'])
         
-        # Update tracker
-        active_tracks = tracker.get_active_tracks()
-        print(f"[TRACKING] Active tracks: {len(active_tracks)}")
-        
-        # Assign track IDs to faces before matching
-        face_track_map = {}
-        for i, face in enumerate(faces):
-            best_match_id = None
-            best_iou = 0
-            
-            for track in active_tracks:
-                iou_score = tracker.iou(face['bbox'], track['bbox'])
-                if iou_score > best_iou and iou_score > 0.3:
-                    best_iou = iou_score
-                    best_match_id = track['track_id']
-            
-            face_track_map[i] = best_match_id
+        print(f"[TRACKING] Active tracks: {len(tracker.tracks)}")
         
-        # Update tracker with all detections
+        # Update tracker with all detections; every detection comes back with a track_id
         tracker.update(detections)
         
-        # Get updated active tracks
-        active_tracks = tracker.get_active_tracks()
-        
         optimization_stats = {
             'total_faces': len(faces),
             'recognized_count': 0,
             'cached_count': 0,
-            'optimization_rate': 0
+            'optimization_rate': 0,
+            'detection_skipped': False
         }
         
         results = []
         faces_needing_recognition = []
         
         for i, face in enumerate(faces):
-            track_id = face_track_map[i]
-            is_tracked = track_id is not None
+            track_id = detections[i]['track_id']
+            # Tracks created by this frame's update weren't tracked before
+            is_tracked = tracker.tracks[track_id]['first_seen'] < tracker.frame_count
             matched_track = None
             
             # Check if we have cached recognition for this track
@@ -678,13 +1716,12 @@ class FaceRecognitionSystem:
                 confidence = matched_track['confidence']
                 needs_recognition = False
                 
-                if track_id:
-                    tracker.update_track_recognition(track_id, {
-                        'name': name,
-                        'id_number': id_number,
-                        'section': section,
-                        'confidence': confidence
-                    })
+                tracker.update_track_recognition(track_id, {
+                    'name': name,
+                    'id_number': id_number,
+                    'section': section,
+                    'confidence': confidence
+                })
             else:
                 needs_recognition = True
                 name = "Unknown"
@@ -699,13 +1736,6 @@ class FaceRecognitionSystem:
                     'track_id': track_id
                 })
             
-            # If no track ID was assigned but face is being tracked, generate one
-            if not track_id and is_tracked:
-                # Generate a track ID based on face position and frame counter
-                bbox = face['bbox']
-                track_id = f"track_{bbox[0]}_{bbox[1]}_{tracker_data['frame_counter']}_{i}"
-                print(f"[TRACKING] Generated new track_id: {track_id}")
-            
             results.append({
                 'bbox': face['bbox'].tolist() if isinstance(face['bbox'], np.ndarray) else face['bbox'],
                 'landmarks': face['landmarks'].tolist() if isinstance(face['landmarks'], np.ndarray) else face['landmarks'],
@@ -720,13 +1750,18 @@ class FaceRecognitionSystem:
                 'recognized': (name != "Unknown")
             })
         
-        # Perform recognition for new faces
-        for face_data in faces_needing_recognition:
+        # Perform recognition for new faces in one batched gallery scan
+        batch_results = []
+        if faces_needing_recognition:
+            batch_results = self.recognize_faces_batch(
+                np.vstack([face_data['embedding'] for face_data in faces_needing_recognition]),
+                section_name
+            )
+
+        for face_data, result in zip(faces_needing_recognition, batch_results):
             i = face_data['index']
-            embedding = face_data['embedding']
             track_id = face_data['track_id']
-            
-            result = self._recognize_single_face(embedding, section_name)
+
             optimization_stats['recognized_count'] += 1
             
             # Update the result
@@ -737,24 +1772,16 @@ class FaceRecognitionSystem:
             results[i]['recognized'] = (result['name'] != "Unknown")
             results[i]['needs_recognition'] = False
             
-            # If no track_id, generate one now
-            if not results[i]['track_id']:
-                bbox = results[i]['bbox']
-                results[i]['track_id'] = f"track_{bbox[0]}_{bbox[1]}_{tracker_data['frame_counter']}_{i}"
-            
-            # Cache the recognition if we have a track_id
-            if results[i]['track_id'] and result['name'] != "Unknown":
-                recognized_tracks[results[i]['track_id']] = {
+            # Cache the recognition for the track
+            if result['name'] != "Unknown":
+                recognized_tracks[track_id] = {
                     'name': result['name'],
                     'id_number': result.get('id_number', 'N/A'),
                     'section': result['section'],
                     'confidence': result['confidence'],
                     'last_update': time.time()
                 }
-                
-                # Update tracker if we have the track
-                if results[i]['track_id'] in [t['track_id'] for t in active_tracks]:
-                    tracker.update_track_recognition(results[i]['track_id'], result)
+                tracker.update_track_recognition(track_id, result)
         
         # Calculate optimization
         if optimization_stats['total_faces'] > 0:
@@ -766,12 +1793,71 @@ class FaceRecognitionSystem:
         
         print(f"[RECOGNITION] Results: {len(results)} faces, {optimization_stats['recognized_count']} recognized")
         print(f"[TRACKING] Track IDs: {[r.get('track_id') for r in results]}")
-        
+
+        return self._finish_recognition(analysis, results, optimization_stats, session_id)
+
+    def _propagate_tracks(self, tracker_data, gray):
+        """Try to skip detection for this frame; True if every live track was moved."""
+        tracker = tracker_data['tracker']
+        prev_gray = tracker_data['prev_gray']
+
+        if prev_gray is None or prev_gray.shape != gray.shape:
+            return False
+        if tracker_data['frames_since_detection'] + 1 >= self.detect_interval:
+            return False
+
+        # Every live track went through recognition on the last detection frame;
+        # unknown faces coast as Unknown and are tried again on the next one
+        if not any(missing == 0 for missing in tracker.disappeared.values()):
+            return False
+
+        return tracker.propagate(prev_gray, gray)
+
+    def _propagated_results(self, tracker_data):
+        tracker = tracker_data['tracker']
+        recognized_tracks = tracker_data['recognized_tracks']
+
+        results = []
+        for track_id, track in tracker.tracks.items():
+            if tracker.disappeared[track_id] > 0:
+                continue
+            identity = recognized_tracks.get(track_id, track)
+            landmarks = track.get('landmarks')
+            results.append({
+                # Same as detected frames: the measured box, not the filtered one
+                'bbox': [int(round(v)) for v in track['measured_bbox']],
+                'landmarks': landmarks.tolist() if isinstance(landmarks, np.ndarray) else landmarks,
+                'name': identity['name'],
+                'id_number': identity.get('id_number', 'N/A'),
+                'section': identity['section'],
+                'confidence': identity['confidence'],
+                'det_score': float(track.get('det_score', 0.0)),
+                'tracked': True,
+                'track_id': track_id,
+                'needs_recognition': False,
+                'recognized': (identity['name'] != "Unknown"),
+                'propagated': True
+            })
+
+        optimization_stats = {
+            'total_faces': len(results),
+            'recognized_count': 0,
+            'cached_count': len(results),
+            'optimization_rate': 100.0,
+            'detection_skipped': True
+        }
+        return results, optimization_stats
+
+    def _finish_recognition(self, analysis, results, optimization_stats, session_id):
+        analysis.faces = results
         # CHECK FOR MODAL - IMPORTANT!
         modal_info = None
         if self.hand_detection_enabled and session_id:
             print("[RECOGNITION] Checking for open palm modal...")
-            modal_info = self.detect_hands_and_check_modal(frame, results, session_id)
+            modal_info = self.detect_hands_and_check_modal(analysis.frame, results, session_id,
+                                                           hand_landmarks=analysis.detected_hands(),
+                                                           frame_scale=analysis.frame_scale)
+            analysis.modal_info = modal_info
             
             if modal_info:
                 print(f"[RECOGNITION] Modal triggered! Adding to face {modal_info.get('track_id')}")
@@ -788,37 +1874,27 @@ class FaceRecognitionSystem:
         
         return results, optimization_stats
     
-    def _recognize_single_face(self, embedding, section_name=None):
+    def _get_gallery(self, section_name=None):
+        if section_name:
+            return self.section_galleries.get(section_name, EmbeddingGallery())
+        return self.global_gallery
+
+    def _build_match_result(self, entry, similarity):
         best_match = None
         best_similarity = -1
         best_name = "Unknown"
         best_id_number = "N/A"
         best_section = None
-        
-        sections_to_search = []
-        if section_name:
-            if section_name in self.face_database['sections']:
-                sections_to_search = [(section_name, self.face_database['sections'][section_name])]
-        else:
-            sections_to_search = [(name, self.face_database['sections'][name]) 
-                                 for name in self.face_database['section_list']]
-        
-        for sec_name, section_data in sections_to_search:
-            for person_id, data in section_data.items():
-                avg_embedding = data.get('avg_embedding')
-                if avg_embedding is not None:
-                    similarity = np.dot(embedding, avg_embedding) / (
-                        np.linalg.norm(embedding) * np.linalg.norm(avg_embedding)
-                    )
-                    
-                    if similarity > best_similarity and similarity > self.recognition_threshold:
-                        best_similarity = similarity
-                        best_match = person_id
-                        best_name = data['name']
-                        best_id_number = data.get('id_number', 'N/A')
-                        best_section = sec_name
-        
-        print(f"[RECOG SINGLE] Result: {best_name} ({best_similarity:.3f})")
+
+        if entry is not None and similarity > self.recognition_threshold:
+            sec_name, person_id = entry
+            data = self.face_database['sections'][sec_name][person_id]
+            best_similarity = similarity
+            best_match = person_id
+            best_name = data['name']
+            best_id_number = data.get('id_number', 'N/A')
+            best_section = sec_name
+
         return {
             'name': best_name,
             'id_number': best_id_number,
@@ -826,7 +1902,60 @@ class FaceRecognitionSystem:
             'confidence': float(best_similarity) if best_similarity > 0 else 0.0,
             'matched_id': best_match
         }
-    
+
+    def _recognize_single_face(self, embedding, section_name=None):
+        with self.gallery_lock.read():
+            gallery = self._get_gallery(section_name)
+            best_idx, similarity = gallery.search(embedding)
+
+            entry = gallery.entries[best_idx] if best_idx is not None else None
+            result = self._build_match_result(entry, similarity)
+        print(f"[RECOG SINGLE] Result: {result['name']} ({result['confidence']:.3f})")
+        return result
+
+    def recognize_faces_batch(self, embeddings, section_name=None, top_k=1):
+        """Recognize an (N x 512) block of embeddings with a single gallery scan.
+
+        Unfiltered searches use the ANN index once the gallery reaches
+        ann_min_size. Returns one result dict per row in the same format as
+        _recognize_single_face. With top_k > 1 each result also carries a
+        'top_k' list of candidate matches, best first.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.size == 0:
+            return []
+        embeddings = np.atleast_2d(embeddings)
+
+        with self.gallery_lock.read():
+            if not section_name and self.ann_index is not None:
+                # District-scale unfiltered search goes through the approximate index
+                candidates = self.ann_index.search_batch(embeddings, top_k=top_k)
+            else:
+                gallery = self._get_gallery(section_name)
+                indices, similarities = gallery.search_batch(embeddings, top_k=top_k)
+                candidates = [
+                    [(gallery.entries[int(idx)], float(sim)) for idx, sim in zip(row_idx, row_sims)]
+                    for row_idx, row_sims in zip(indices, similarities)
+                ]
+
+            results = []
+            for row_candidates in candidates:
+                if row_candidates:
+                    result = self._build_match_result(*row_candidates[0])
+                else:
+                    result = self._build_match_result(None, -1.0)
+
+                if top_k > 1:
+                    result['top_k'] = [
+                        self._build_match_result(entry, sim)
+                        for entry, sim in row_candidates
+                        if sim > self.recognition_threshold
+                    ]
+                results.append(result)
+
+        print(f"[RECOG BATCH] {len(results)} face(s): {[r['name'] for r in results]}")
+        return results
+
     def validate_id_number(self, id_number, for_registration=True):
         if not id_number or not id_number.strip():
             return False, "ID number is required"
@@ -959,11 +2088,8 @@ class FaceRecognitionSystem:
         avg_embedding = np.mean(all_embeddings, axis=0)
         avg_embedding = avg_embedding / np.linalg.norm(avg_embedding)
         
-        if section_name not in self.face_database['sections']:
-            self.face_database['sections'][section_name] = {}
-        
         person_id = f"person_{id_number}"
-        self.face_database['sections'][section_name][person_id] = {
+        person = {
             'name': registration['person_name'],
             'id_number': id_number,
             'embeddings': all_embeddings,
@@ -976,15 +2102,24 @@ class FaceRecognitionSystem:
                 'angles_collected': {angle: len(embeds) for angle, embeds in registration['angles'].items()}
             }
         }
-        
-        self.face_database['id_map'][id_number] = {
-            'section': section_name,
-            'person_id': person_id
-        }
-        
-        self.face_database['section_list'] = list(self.face_database['sections'].keys())
-        self.save_database()
-        
+
+        with self.gallery_lock.write():
+            with self.db_lock:
+                if section_name not in self.face_database['sections']:
+                    self.face_database['sections'][section_name] = {}
+
+                self.face_database['sections'][section_name][person_id] = person
+                self.face_database['id_map'][id_number] = {
+                    'section': section_name,
+                    'person_id': person_id
+                }
+
+                self.face_database['section_list'] = list(self.face_database['sections'].keys())
+                self._journal_change(register_event(section_name, person_id, person))
+
+            self._rebuild_section_gallery(section_name)
+            self._update_ann_index(added=[(section_name, person_id)])
+
         person_name = registration['person_name']
         del self.active_registrations[session_id]
         
@@ -1008,6 +2143,10 @@ class FaceRecognitionSystem:
         return {'success': False, 'message': 'No active registration found'}
     
     def get_database_stats(self):
+        with self.gallery_lock.read():
+            return self._get_database_stats()
+
+    def _get_database_stats(self):
         total_persons = 0
         total_samples = 0
         
@@ -1044,6 +2183,10 @@ class FaceRecognitionSystem:
         }
     
     def get_section_persons(self, section_name):
+        with self.gallery_lock.read():
+            return self._get_section_persons(section_name)
+
+    def _get_section_persons(self, section_name):
         if section_name not in self.face_database['sections']:
             return []
         
@@ -1062,22 +2205,33 @@ class FaceRecognitionSystem:
         return persons
     
     def delete_section(self, section_name):
+        with self.gallery_lock.write():
+            return self._delete_section(section_name)
+
+    def _delete_section(self, section_name):
         if section_name in self.face_database['sections']:
-            section_data = self.face_database['sections'][section_name]
-            for person_id, data in section_data.items():
-                id_number = data.get('id_number')
-                if id_number and id_number in self.face_database['id_map']:
-                    del self.face_database['id_map'][id_number]
-            
-            del self.face_database['sections'][section_name]
-            self.face_database['section_list'] = list(self.face_database['sections'].keys())
-            self.save_database()
+            with self.db_lock:
+                section_data = self.face_database['sections'][section_name]
+                for person_id, data in section_data.items():
+                    id_number = data.get('id_number')
+                    if id_number and id_number in self.face_database['id_map']:
+                        del self.face_database['id_map'][id_number]
+
+                removed_keys = [(section_name, person_id) for person_id in section_data]
+                del self.face_database['sections'][section_name]
+                self.face_database['section_list'] = list(self.face_database['sections'].keys())
+                self._journal_change(delete_section_event(section_name))
+
+            self._rebuild_section_gallery(section_name)
+            self._update_ann_index(removed=removed_keys)
             return {'success': True, 'message': f'Section "{section_name}" deleted successfully'}
         return {'success': False, 'message': f'Section "{section_name}" not found'}
     
     def clear_session_tracking(self, session_id):
-        if session_id in self.session_tracking:
-            del self.session_tracking[session_id]
+        removed = self.session_tracking.pop(session_id)
+        if self.hand_detection_enabled:
+            self.hand_graphs.release(session_id)
+        if removed is not None:
             return {'success': True, 'message': f'Tracking cleared for session {session_id}'}
         return {'success': False, 'message': f'No tracking data for session {session_id}'}
     
@@ -1086,4 +2240,115 @@ class FaceRecognitionSystem:
         if not is_valid:
             return {'available': False, 'message': message}
         
-        return {'available': True, 'message': f'ID number "{id_number}" is available'}
\ No newline at end of file
+        return {'available': True, 'message': f'ID number "{id_number}" is available'}
+
+
+class FaceEngineNotReady(Exception):
+    """The face engine is still loading (or failed to load)."""
+
+    def __init__(self, status):
+        super().__init__(status['error'] or f"Face engine is {status['state']}")
+        self.status = status
+
+
+class FaceEngine:
+    """Builds a FaceRecognitionSystem in a background thread.
+
+    Stands in for the system: attribute access starts loading if nobody
+    has yet, waits up to wait_timeout seconds for it and then delegates,
+    or raises FaceEngineNotReady. Callbacks added with when_ready() run on
+    the loader thread once the system exists.
+    """
+
+    def __init__(self, wait_timeout=15.0, **system_kwargs):
+        self.wait_timeout = wait_timeout
+        self._system_kwargs = system_kwargs
+        self._system = None
+        self._state = 'idle'
+        self._error = None
+        self._started_at = None
+        self._load_seconds = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def start(self):
+        """Start loading in the background; no-op once started."""
+        with self._lock:
+            if self._state != 'idle':
+                return
+            self._state = 'loading'
+            self._started_at = time.time()
+        threading.Thread(target=self._load, name='face-engine-loader', daemon=True).start()
+
+    def _load(self):
+        try:
+            system = FaceRecognitionSystem(**self._system_kwargs)
+        except Exception as e:
+            print(f"[ENGINE] Face engine failed to load: {e}")
+            with self._lock:
+                self._state = 'failed'
+                self._error = str(e)
+            self._loaded.set()
+            return
+
+        with self._lock:
+            self._system = system
+            self._state = 'ready'
+            self._load_seconds = time.time() - self._started_at
+            callbacks, self._callbacks = self._callbacks, []
+        self._loaded.set()
+        print(f"[ENGINE] Face engine ready in {self._load_seconds:.1f}s")
+
+        for callback in callbacks:
+            self._run_callback(callback, system)
+
+    @staticmethod
+    def _run_callback(callback, system):
+        try:
+            callback(system)
+        except Exception as e:
+            print(f"[ENGINE] Ready callback failed: {e}")
+
+    def when_ready(self, callback):
+        """Call callback(system) once loaded (right away if it already is).
+
+        Doesn't start loading: with preload off the callback waits for the
+        first vision request.
+        """
+        with self._lock:
+            system = self._system
+            if system is None:
+                self._callbacks.append(callback)
+        if system is not None:
+            self._run_callback(callback, system)
+
+    @property
+    def ready(self):
+        return self._system is not None
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'ready': self._system is not None,
+                'error': self._error,
+                'loading_seconds': (time.time() - self._started_at
+                                    if self._state == 'loading' else None),
+                'load_seconds': self._load_seconds
+            }
+
+    def wait(self, timeout=None):
+        """Return the loaded system, or raise FaceEngineNotReady after timeout seconds."""
+        self.start()
+        self._loaded.wait(timeout)
+        system = self._system
+        if system is None:
+            raise FaceEngineNotReady(self.status())
+        return system
+
+    def __getattr__(self, name):
+        # Only reached for attributes of the wrapped system
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.wait(self.wait_timeout), name)
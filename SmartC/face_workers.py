@@ -0,0 +1,259 @@
+# face_workers.py - Process pool running one face model per worker
+#
+# Each worker process loads its own FaceAnalysis model once. Frames are handed
+# over through preallocated shared-memory slots (the parent converts BGR->RGB
+# straight into the slot), so only the small per-face results are pickled.
+# Tracking and gallery matching stay in the parent process.
+import atexit
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+_worker_app = None
+_worker_segments = {}
+
+# ONNX Runtime tuning for the face models. None keeps ORT's default.
+DEFAULT_INFERENCE_PROFILE = {
+    'intra_op_threads': None,       # threads within one operator (ORT default: one per core)
+    'inter_op_threads': None,       # threads across independent nodes (parallel mode only)
+    'graph_optimization': 'all',    # disable / basic / extended / all
+    'execution_mode': 'sequential', # sequential / parallel
+    'warmup_runs': 1,               # synthetic passes per detector size at load
+}
+
+
+def resolve_inference_profile(profile=None):
+    """DEFAULT_INFERENCE_PROFILE updated with the given keys."""
+    merged = dict(DEFAULT_INFERENCE_PROFILE)
+    merged.update(profile or {})
+    unknown = set(merged) - set(DEFAULT_INFERENCE_PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown inference profile keys: {sorted(unknown)}")
+    return merged
+
+
+def session_options(profile):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if profile['intra_op_threads']:
+        options.intra_op_num_threads = int(profile['intra_op_threads'])
+    if profile['inter_op_threads']:
+        options.inter_op_num_threads = int(profile['inter_op_threads'])
+    options.graph_optimization_level = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[profile['graph_optimization']]
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if profile['execution_mode'] == 'parallel'
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    return options
+
+
+def load_face_model(model_name, det_sizes, profile=None, providers=('CPUExecutionProvider',)):
+    """FaceAnalysis with ONNX sessions built from the profile, prepared and warmed up.
+
+    FaceAnalysis doesn't pass session options through to ONNX Runtime, so
+    each model's session is recreated with them before prepare().
+    """
+    from insightface.app import FaceAnalysis
+
+    profile = resolve_inference_profile(profile)
+    app = FaceAnalysis(name=model_name, providers=list(providers))
+
+    models = [model for model in app.models.values() if getattr(model, 'session', None) is not None]
+    if models:
+        from insightface.model_zoo.model_zoo import PickableInferenceSession
+        options = session_options(profile)
+        for model in models:
+            model.session = PickableInferenceSession(model.model_file, sess_options=options,
+                                                     providers=list(providers))
+
+    app.prepare(ctx_id=-1, det_size=tuple(det_sizes[0]))  # Use CPU
+    warm_up_face_model(app, det_sizes, profile['warmup_runs'])
+    return app
+
+
+def warm_up_face_model(app, det_sizes, runs=1):
+    """Run every detector size and per-face model on synthetic input.
+
+    ONNX Runtime allocates buffers and picks kernels on the first run of
+    each input shape; doing it here keeps that off the first real frames.
+    """
+    if runs <= 0:
+        return
+    rng = np.random.default_rng(0)
+    for size in det_sizes:
+        frame = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        for _ in range(runs):
+            run_face_model(app, frame, size)
+
+    # Noise contains no faces, so give the per-face models a synthetic one
+    if getattr(app, 'det_model', None) is None:
+        return
+    from insightface.app.common import Face
+    from insightface.utils.face_align import arcface_dst
+
+    frame = rng.integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    face = Face(bbox=np.array([56, 56, 168, 168], dtype=np.float32), kps=arcface_dst + 56,
+                det_score=np.float32(1.0))
+    for _ in range(runs):
+        for taskname, model in app.models.items():
+            if taskname != 'detection':
+                model.get(frame, face)
+
+
+def run_face_model(app, rgb_frame, det_size=None):
+    """FaceAnalysis.get() with the detector run at det_size (its prepared size if None).
+
+    The detector accepts any input size, so one loaded model serves every
+    size. Returns a list of (bbox, kps, normed_embedding, det_score) tuples.
+    """
+    det_model = getattr(app, 'det_model', None)
+    if det_size is None or det_model is None:
+        faces = app.get(rgb_frame)
+    else:
+        from insightface.app.common import Face
+        bboxes, kpss = det_model.detect(rgb_frame, input_size=tuple(det_size), max_num=0, metric='default')
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=None if kpss is None else kpss[i], det_score=bboxes[i, 4])
+            for taskname, model in app.models.items():
+                if taskname != 'detection':
+                    model.get(rgb_frame, face)
+            faces.append(face)
+    return [(face.bbox, face.kps, face.normed_embedding, float(face.det_score)) for face in faces]
+
+
+def _init_worker(model_name, det_sizes, profile):
+    global _worker_app
+    # Keep each worker to its share of the cores
+    os.environ['OMP_NUM_THREADS'] = str(profile['intra_op_threads'])
+
+    _worker_app = load_face_model(model_name, det_sizes, profile)
+    print(f"[WORKER {os.getpid()}] Face model loaded")
+
+
+def _attach_segment(name):
+    segment = _worker_segments.get(name)
+    if segment is None:
+        # Spawned workers share the parent's resource tracker, which already
+        # tracks this segment; the parent unlinks it on shutdown
+        segment = shared_memory.SharedMemory(name=name)
+        _worker_segments[name] = segment
+    return segment
+
+
+def _detect_in_worker(segment_name, shape, rgb_frame=None, det_size=None):
+    if rgb_frame is None:
+        segment = _attach_segment(segment_name)
+        rgb_frame = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+
+    return run_face_model(_worker_app, rgb_frame, det_size)
+
+
+def _ping():
+    return os.getpid()
+
+
+_launch_lock = threading.Lock()
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    """Spawned worker that starts from this module instead of the app's __main__.
+
+    A spawned child normally re-imports the parent's main script (main.py)
+    before running anything, and with it the Flask app, the blueprints and
+    their module-level camera. The child prepares itself from whatever is in
+    sys.modules['__main__'] while the parent launches it, so that entry is
+    pointed at this module just for the launch.
+    """
+
+    @staticmethod
+    def _Popen(process_obj):
+        with _launch_lock:
+            main_module = sys.modules['__main__']
+            sys.modules['__main__'] = sys.modules[__name__]
+            try:
+                return multiprocessing.context.SpawnProcess._Popen(process_obj)
+            finally:
+                sys.modules['__main__'] = main_module
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+class InferencePool:
+    """N worker processes, each with a preloaded face model."""
+
+    def __init__(self, num_workers, model_name='buffalo_l', det_sizes=((640, 640),),
+                 max_frame_shape=(1080, 1920, 3), profile=None):
+        self.num_workers = num_workers
+        # Unless the profile says otherwise, each worker gets its share of the cores
+        self.profile = resolve_inference_profile(profile)
+        if not self.profile['intra_op_threads']:
+            self.profile['intra_op_threads'] = max(1, (os.cpu_count() or 1) // num_workers)
+
+        # spawn: forking a process that already runs ONNX Runtime/Flask threads is unsafe.
+        # Workers import only this module (see _WorkerProcess), never main.py
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=_WorkerContext(),
+            initializer=_init_worker,
+            initargs=(model_name, tuple(det_sizes), self.profile)
+        )
+
+        # Two slots per worker lets the next frame be copied in while one is running
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.segments = [shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+                         for _ in range(num_workers * 2)]
+        self.free_slots = queue.Queue()
+        for slot in range(len(self.segments)):
+            self.free_slots.put(slot)
+
+        atexit.register(self.shutdown)
+
+    def warm_up(self):
+        """Start every worker now instead of on the first frames."""
+        futures = [self.executor.submit(_ping) for _ in range(self.num_workers)]
+        return [f.result() for f in futures]
+
+    def detect(self, bgr_frame, det_size=None):
+        """Run detection + embedding on a BGR frame in a worker.
+
+        Returns a list of (bbox, kps, normed_embedding, det_score) tuples.
+        """
+        if bgr_frame.nbytes > self.slot_bytes:
+            # Oversized frame: fall back to pickling it
+            rgb_frame = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2RGB)
+            return self.executor.submit(_detect_in_worker, None, rgb_frame.shape, rgb_frame, det_size).result()
+
+        slot = self.free_slots.get()
+        try:
+            segment = self.segments[slot]
+            view = np.ndarray(bgr_frame.shape, dtype=np.uint8, buffer=segment.buf)
+            cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2RGB, dst=view)
+            return self.executor.submit(_detect_in_worker, segment.name, bgr_frame.shape, None, det_size).result()
+        finally:
+            self.free_slots.put(slot)
+
+    def shutdown(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        for segment in self.segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
@@ -1,5 +1,6 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, session, flash, send_from_directory
 import cv2
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
@@ -13,6 +14,7 @@ from dotenv import load_dotenv
 import html
 
 import pickle
+import struct
 import threading
 import time
 import json
@@ -31,9 +33,16 @@ import base64
 import io
 from PIL import Image
 import face_system
+from face_system import FaceEngineNotReady
 import threading
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 from sqlalchemy import func
-from Sub_app.models import db, Student, Teacher, Attendance, Score, SystemSettings, get_student_analytics, evaluate_student_status, PasswordResetToken
+from Sub_app.models import db, Student, Teacher, Attendance, Score, SystemSettings, get_student_analytics, get_student_analytics_for, get_dashboard_data, PasswordResetToken
+from Sub_app.models import class_score_stats, apply_attendance_rollup, apply_score_rollup, ensure_rollups, analytics_cache
 from Sub_app.admin import admin_bp
 from Sub_app.update_attendance import attendance_bp
 
@@ -51,6 +60,27 @@ app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE_PATH}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db.init_app(app)
 
+# Create missing tables (e.g. the rollups on an older database) and backfill
+# the rollups here, so it also happens under gunicorn / flask run. Every
+# worker runs this; ensure_rollups() lets only the first one backfill.
+with app.app_context():
+    try:
+        db.create_all()
+        backfilled = ensure_rollups()
+        if backfilled:
+            print(f"📊 Rollup tables backfilled: {backfilled}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Could not prepare rollup tables: {e}")
+
+# get_student_analytics results are cached until the data changes (a write
+# from either app or any worker invalidates them). ANALYTICS_CACHE_URL
+# (redis://...) also shares the cached results between processes.
+analytics_cache.configure(url=os.getenv("ANALYTICS_CACHE_URL"),
+                          max_entries=int(os.getenv("ANALYTICS_CACHE_SIZE", "128")),
+                          ttl=int(os.getenv("ANALYTICS_CACHE_TTL", "600")),
+                          enabled=os.getenv("ANALYTICS_CACHE", "1") == "1")
+
 # Register Blueprints
 app.register_blueprint(admin_bp)
 app.register_blueprint(attendance_bp)
@@ -653,41 +683,17 @@ def dashboard():
     score_weight = teacher.score_weight if teacher else 0.7
     attendance_weight = teacher.attendance_weight if teacher else 0.3
 
-    # Analytics data with status evaluations
-    raw_student = get_student_analytics(score_weight=score_weight, attendance_weight=attendance_weight)
-    
-    # Add status evaluations to each student
-    student_evaluations = evaluate_student_status()
-    for student in raw_student:
-        # Find corresponding evaluation
-        eval_data = next((e for e in student_evaluations if e['student']['student_id'] == student['student_id']), None)
-        if eval_data:
-            student['flags'] = eval_data['flags']
-            student['status_info'] = eval_data['status']
-        else:
-            student['flags'] = []
-            student['status_info'] = {'overall_status': 'good'}
-
-    # Get all students
-    students = Student.query.all()
-    today = datetime.now().date()
-
-    # Attach today's attendance status to each student
-    for s in students:
-        attendance_record = Attendance.query.filter_by(student_id=s.id, date=today).first()
-        # Add a property `status` to each student object
-        s.status = attendance_record.status if attendance_record else "Absent"
-        # Optional: also add a boolean for easier JS handling
-        s.is_present = True if s.status == "Present" else False
+    # Analytics with status flags, plus students with today's attendance
+    data = get_dashboard_data(score_weight=score_weight, attendance_weight=attendance_weight)
 
     # Pass students and other info to template
     import time
     return render_template(
         "dashboard.html",
-        students=students,
+        students=data["students"],
         teacher=teacher,
-        raw_student=raw_student,
-        today=today,
+        raw_student=data["raw_student"],
+        today=data["today"],
         timestamp=int(time.time())
     )
 
@@ -714,32 +720,16 @@ def send_student_report():
         score_weight = teacher.score_weight if teacher else 0.7
         attendance_weight = teacher.attendance_weight if teacher else 0.3
         
-        analytics = get_student_analytics(score_weight=score_weight, attendance_weight=attendance_weight)
-        student_analytics = next((s for s in analytics if s['student_id'] == student_id), None)
-        
-        # Get attendance records
-        attendance_records = Attendance.query.filter_by(student_id=student.id).all()
-        present_count = sum(1 for a in attendance_records if a.status == "Present")
-        late_count = sum(1 for a in attendance_records if a.status == "Late")
-        absent_count = sum(1 for a in attendance_records if a.status == "Absent")
-        total_days = len(attendance_records) if attendance_records else 1
-        attendance_rate = round((present_count / total_days) * 100, 2) if total_days > 0 else 0
-        
-        # Get scores - FIXED: Use student.student_id (string) instead of student.id
-        scores = Score.query.filter_by(student_id=student.student_id).all()
-        print(f"📊 Found {len(scores)} scores for student {student.student_id}")
+        # Only this student's rows, not the whole school
+        student_analytics = get_student_analytics_for(student_id, score_weight=score_weight,
+                                                      attendance_weight=attendance_weight)
         
-        subject_scores = {}
-        for score in scores:
-            # FIXED: Use 'subject' instead of 'subject_name' and 'points' instead of 'score'
-            if score.subject not in subject_scores:
-                subject_scores[score.subject] = []
-            subject_scores[score.subject].append(score.points)
-        
-        print(f"📚 Subject scores: {subject_scores}")
-        
-        subject_averages = {subject: round(sum(points) / len(points), 2) 
-                          for subject, points in subject_scores.items() if points}
+        # Attendance counts and per-subject averages come from the same analytics
+        present_count = student_analytics["present_count"]
+        late_count = student_analytics["late_count"]
+        absent_count = student_analytics["absent_count"]
+        attendance_rate = student_analytics["attendance"]
+        subject_averages = student_analytics["raw_subject_scores"]
         
         print(f"📈 Subject averages: {subject_averages}")
         
@@ -1145,10 +1135,12 @@ def mark_attendance(student_id, student_name):
                 time_in=datetime.now().time()
             )
             db.session.add(new_attendance)
+            apply_attendance_rollup(student_id, "Present")
             db.session.commit()
             print(f"✅ Attendance marked for {student_name}")
         
     except Exception as e:
+        db.session.rollback()
         print(f"❌ Error marking attendance for {student_name}: {e}")
         
 
@@ -1241,25 +1233,10 @@ def get_quick_stats():
         )
         active_students_change = 5
 
-        avg_engagement_query = db.session.query(func.avg(Score.points)).filter(
-            Score.student_id.in_(student_ids)
-        )
-
-        if subject:
-            avg_engagement_query = avg_engagement_query.filter(Score.subject == subject)
-
-        avg_engagement = avg_engagement_query.scalar() or 0
-        avg_engagement = round(avg_engagement, 2)
+        # Scores reference students by their student_id code, not Student.id;
+        # the aggregates come from the per-(student, subject) rollup once it's ready
+        avg_engagement, low_performers = class_score_stats([s.student_id for s in students_in_class], subject)
         avg_engagement_change = -2
-
-        low_performers = (
-            db.session.query(Student.student_id)
-            .join(Score, Score.student_id == Student.student_id)
-            .filter(Student.id.in_(student_ids))
-            .group_by(Student.student_id)
-            .having(func.avg(Score.points) < 70)
-            .count()
-        )
         needs_assistance_change = 1
 
         total_attendance_today = (
@@ -1416,11 +1393,13 @@ def save_points():
         )
 
         db.session.add(score)
+        apply_score_rollup(score)
         db.session.commit()
 
         return jsonify({"success": True, "message": "Points saved!"})
 
     except Exception as e:
+        db.session.rollback()
         print("❌ Error in /save-points:", str(e))
         return jsonify({"success": False, "message": str(e)}), 400
 
@@ -1675,6 +1654,20 @@ def generate_student_insight():
     attendance = data.get("attendance", "N/A")
     subjects = data.get("subjects", {})
 
+    # With a student_id, use the stored figures (that student's rows only)
+    # instead of whatever the page sent
+    if data.get("student_id"):
+        teacher = Teacher.query.filter_by(teacher_id=session.get("teacher_id")).first()
+        student_analytics = get_student_analytics_for(
+            data["student_id"],
+            score_weight=teacher.score_weight if teacher else 0.7,
+            attendance_weight=teacher.attendance_weight if teacher else 0.3
+        )
+        if student_analytics:
+            name = f"{student_analytics['first_name']} {student_analytics['last_name']}"
+            attendance = student_analytics["attendance"]
+            subjects = student_analytics["subject_scores"]
+
    
     prompt = f"""
     You are an expert educational data analyst. Analyze the following student performance data and generate a concise, data-driven report.
@@ -1749,11 +1742,116 @@ def get_student(student_id):
     
     return jsonify({"success": False})
 
-# Initialize face system
-face_system = face_system.FaceRecognitionSystem()
+# Binary frame uploads skip the base64 data URL: the body is read straight
+# into a preallocated NumPy buffer and handed to cv2.imdecode
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+
+def read_upload_buffer():
+    """Read a raw image body or multipart 'image' file; returns (buffer, error)."""
+    # Caps the body however it arrives, the multipart parser included; must be
+    # set before anything reads the stream. One byte over so a chunked body
+    # that doesn't fit shows up as too long instead of silently truncated
+    request.max_content_length = MAX_FRAME_BYTES + 1
+    try:
+        upload = request.files.get('image')
+        if upload is not None:
+            buffer = np.frombuffer(upload.read(), np.uint8)
+        elif request.content_length:
+            if request.content_length > MAX_FRAME_BYTES:
+                return None, 'Frame too large'
+            buffer = np.empty(request.content_length, np.uint8)
+            view = memoryview(buffer)
+            received = 0
+            while received < len(buffer):
+                count = request.stream.readinto(view[received:])
+                if not count:
+                    break
+                received += count
+            buffer = buffer[:received]
+        else:
+            # Chunked upload without a length
+            buffer = np.frombuffer(request.get_data(cache=False), np.uint8)
+            if buffer.size > MAX_FRAME_BYTES:
+                return None, 'Frame too large'
+    except RequestEntityTooLarge:
+        return None, 'Frame too large'
+    
+    if buffer.size == 0:
+        return None, 'No image provided'
+    return buffer, None
+
+def read_frame_upload():
+    """Decode a raw image body or multipart 'image' file at full size; returns (frame, error)."""
+    buffer, error = read_upload_buffer()
+    if error:
+        return None, error
+    
+    frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if frame is None:
+        return None, 'Failed to decode image'
+    return frame, None
 
-# Lock for thread safety
-system_lock = threading.Lock()
+# Initialize face system
+# FACE_INFERENCE_PROCESSES > 0 runs the face model in that many worker processes.
+# The workers import only face_workers, never this module.
+# FACE_DETECT_INTERVAL > 1 runs full detection only every N frames per session
+# and moves the known faces with optical flow in between.
+FACE_INFERENCE_PROCESSES = int(os.getenv("FACE_INFERENCE_PROCESSES", "0"))
+FACE_DETECT_INTERVAL = int(os.getenv("FACE_DETECT_INTERVAL", "1"))
+# Camera sessions idle for FACE_SESSION_TTL seconds, or beyond FACE_MAX_SESSIONS, are dropped.
+FACE_MAX_SESSIONS = int(os.getenv("FACE_MAX_SESSIONS", "256"))
+FACE_SESSION_TTL = float(os.getenv("FACE_SESSION_TTL", "1800"))
+# FACE_HAND_ROI=1 searches for hands only in each detected face's personal zone.
+FACE_HAND_ROI = os.getenv("FACE_HAND_ROI", "0") == "1"
+# Detector input sizes, e.g. "640,480,320": sessions whose faces are large use the smaller ones.
+FACE_DET_SIZES = [(int(size), int(size)) for size in os.getenv("FACE_DET_SIZES", "640,480,320").split(',') if size.strip()]
+# ONNX Runtime profile for the face models; unset variables keep the defaults
+# (worker processes default to an equal share of the cores each).
+FACE_INFERENCE_PROFILE = {key: cast(os.environ[env]) for key, env, cast in (
+    ('intra_op_threads', 'FACE_INTRA_OP_THREADS', int),
+    ('inter_op_threads', 'FACE_INTER_OP_THREADS', int),
+    ('graph_optimization', 'FACE_GRAPH_OPTIMIZATION', str),
+    ('execution_mode', 'FACE_EXECUTION_MODE', str),
+    ('warmup_runs', 'FACE_WARMUP_RUNS', int),
+) if os.getenv(env)}
+# The models and face database load in a background thread (FaceEngine), so
+# non-vision pages serve right away. Vision routes wait up to FACE_ENGINE_WAIT
+# seconds for it and then answer 503; /api/face_engine_status reports progress.
+# FACE_ENGINE_PRELOAD=0 defers loading until the first vision request.
+FACE_ENGINE_WAIT = float(os.getenv("FACE_ENGINE_WAIT", "15"))
+FACE_ENGINE_PRELOAD = os.getenv("FACE_ENGINE_PRELOAD", "1") == "1"
+face_system = face_system.FaceEngine(wait_timeout=FACE_ENGINE_WAIT,
+                                     inference_processes=FACE_INFERENCE_PROCESSES,
+                                     detect_interval=FACE_DETECT_INTERVAL,
+                                     max_sessions=FACE_MAX_SESSIONS,
+                                     session_ttl=FACE_SESSION_TTL,
+                                     hand_roi_mode=FACE_HAND_ROI,
+                                     det_sizes=FACE_DET_SIZES,
+                                     inference_profile=FACE_INFERENCE_PROFILE)
+if FACE_ENGINE_PRELOAD:
+    face_system.start()
+
+# FaceRecognitionSystem does its own locking: per-session tracker locks,
+# a reader-writer lock around the gallery and a bounded inference pool
+
+@app.errorhandler(FaceEngineNotReady)
+def face_engine_not_ready(error):
+    return jsonify(engine_not_ready_payload(error)), 503
+
+def engine_not_ready_payload(error):
+    return {
+        'success': False,
+        'loading': error.status['state'] == 'loading',
+        'message': 'Face recognition is still loading, try again shortly'
+                   if error.status['state'] == 'loading' else f'Face recognition unavailable: {error}',
+        'engine': error.status
+    }
+
+@app.route('/api/face_engine_status', methods=['GET'])
+def face_engine_status():
+    """Readiness of the face engine: 200 once loaded, 503 while loading or failed."""
+    status = face_system.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 # Predefined sections
 DEFAULT_SECTIONS = []  # Your hardcoded defaults
@@ -1866,8 +1964,7 @@ def update_teacher_settings():
 @app.route('/api/sections', methods=['GET'])
 def get_sections():
     """Get all available sections."""
-    with system_lock:
-        sections = face_system.get_all_sections()
+    sections = face_system.get_all_sections()
     
     # Add default sections that might not have any persons yet
     existing_section_names = [s['name'] for s in sections]
@@ -1892,8 +1989,7 @@ def create_section():
     if not section_name:
         return jsonify({'success': False, 'message': 'Section name is required'})
     
-    with system_lock:
-        result = face_system.create_section(section_name)
+    result = face_system.create_section(section_name)
     
     return jsonify(result)
 
@@ -1917,8 +2013,7 @@ def start_registration():
     # Generate session ID
     session_id = str(uuid.uuid4())
     
-    with system_lock:
-        result = face_system.start_registration(session_id, person_name, id_number, section_name, samples_per_angle)
+    result = face_system.start_registration(session_id, person_name, id_number, section_name, samples_per_angle)
     
     if result['success']:
         session['registration_session'] = session_id
@@ -1937,8 +2032,7 @@ def check_id_availability():
     if not id_number:
         return jsonify({'available': False, 'message': 'ID number is required'})
     
-    with system_lock:
-        result = face_system.check_id_availability(id_number)
+    result = face_system.check_id_availability(id_number)
     
     return jsonify(result)
 
@@ -1961,8 +2055,21 @@ def process_registration_frame():
     if frame is None:
         return jsonify({'success': False, 'message': 'Failed to decode image'})
     
-    with system_lock:
-        result = face_system.process_registration_frame(session_id, frame)
+    result = face_system.process_registration_frame(session_id, frame)
+    
+    return jsonify(result)
+
+@app.route('/api/process_registration_frame_binary', methods=['POST'])
+def process_registration_frame_binary():
+    """/api/process_registration_frame for a raw image body or multipart 'image' file."""
+    if 'registration_session' not in session:
+        return jsonify({'success': False, 'message': 'No active registration session'})
+    
+    frame, error = read_frame_upload()
+    if error:
+        return jsonify({'success': False, 'message': error})
+    
+    result = face_system.process_registration_frame(session['registration_session'], frame)
     
     return jsonify(result)
 
@@ -1973,8 +2080,7 @@ def next_registration_angle():
     
     session_id = session['registration_session']
     
-    with system_lock:
-        result = face_system.next_registration_angle(session_id)
+    result = face_system.next_registration_angle(session_id)
     
     return jsonify(result)
 
@@ -1985,8 +2091,7 @@ def finish_registration():
     
     session_id = session['registration_session']
     
-    with system_lock:
-        result = face_system.finish_registration(session_id)
+    result = face_system.finish_registration(session_id)
     
     if result['success']:
         # Clear session
@@ -2004,8 +2109,7 @@ def cancel_registration():
     
     session_id = session['registration_session']
     
-    with system_lock:
-        result = face_system.cancel_registration(session_id)
+    result = face_system.cancel_registration(session_id)
     
     # Clear session
     session.pop('registration_session', None)
@@ -2027,43 +2131,165 @@ def recognize_face():
     # Get hand detection setting from request (default to True)
     enable_hand_detection = request.json.get('enable_hand_detection', True)
     
-    # Get session ID or generate one
-    session_id = request.json.get('session_id')
-    if not session_id:
-        # Generate a session ID for tracking
-        session_id = str(uuid.uuid4())
+    # Without a session ID (tracking off) the frame is analyzed on its own
+    # and no tracking state is kept for it
+    session_id = request.json.get('session_id') or None
     
-    # Decode base64 image
+    # Decode base64 image (reduced when the session's faces are large enough)
     image_data = request.json['image'].split(',')[1]
     nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    frame, frame_scale = face_system.decode_frame(nparr, session_id)
     
     if frame is None:
         return jsonify({'success': False, 'message': 'Failed to decode image'})
     
-    with system_lock:
-        results, optimization_stats = face_system.recognize_faces_with_tracking(frame, section_name, session_id)
-        
-        # Get hand landmarks if hand detection is enabled
-        hand_landmarks = []
-        if enable_hand_detection and face_system.hand_detection_enabled:
-            print("Detecting hands for recognition request...")
-            hand_landmarks = face_system.hand_detector.detect_hands(frame)
-            print(f"Detected {len(hand_landmarks)} hand(s)")
+    return recognition_response(frame, section_name, session_id, enable_hand_detection, frame_scale)
+
+@app.route('/api/recognize_face_binary', methods=['POST'])
+def recognize_face_binary():
+    """/api/recognize_face for binary uploads.
+
+    The frame is the raw JPEG/PNG request body (or a multipart 'image' file);
+    section, session_id and enable_hand_detection go in the query string or form.
+    """
+    buffer, error = read_upload_buffer()
+    if error:
+        return jsonify({'success': False, 'message': error})
     
-    return jsonify({
+    section_name = request.values.get('section') or None
+    enable_hand_detection = request.values.get('enable_hand_detection', 'true').lower() not in ('0', 'false', 'no')
+    session_id = request.values.get('session_id') or None
+    
+    frame, frame_scale = face_system.decode_frame(buffer, session_id)
+    if frame is None:
+        return jsonify({'success': False, 'message': 'Failed to decode image'})
+    
+    return recognition_response(frame, section_name, session_id, enable_hand_detection, frame_scale)
+
+def recognition_response(frame, section_name, session_id, enable_hand_detection, frame_scale=1.0):
+    return jsonify(recognition_payload(frame, section_name, session_id, enable_hand_detection, frame_scale))
+
+def recognition_payload(frame, section_name, session_id, enable_hand_detection, frame_scale=1.0):
+    # Frames of a session queue behind a one-frame slot; superseded ones are dropped.
+    # Coordinates in the result are in the uploaded frame's pixels even if
+    # decode_frame() reduced it (frame_scale).
+    analysis = face_system.analyze_latest_frame(frame, section_name, session_id, frame_scale)
+    if analysis is None:
+        return {
+            'success': False,
+            'dropped': True,
+            'message': 'Frame dropped: a newer frame for this session arrived',
+            'session_id': session_id
+        }
+    results, optimization_stats = analysis.faces, analysis.optimization_stats
+    
+    # Hand landmarks come from the same pass the modal check used
+    hand_landmarks = []
+    if enable_hand_detection and face_system.hand_detection_enabled:
+        hand_landmarks = analysis.hand_landmarks
+        print(f"Detected {len(hand_landmarks)} hand(s)")
+    
+    return {
         'success': True,
         'faces': results,
         'optimization_stats': optimization_stats,
         'hand_landmarks': hand_landmarks,  # Add hand landmarks to response
         'session_id': session_id,
+        'dropped_frames': analysis.dropped_frames,
         'timestamp': datetime.now().isoformat(),
         'debug_info': {
             'hand_detection_enabled': face_system.hand_detection_enabled,
             'hands_detected': len(hand_landmarks),
             'faces_detected': len(results)
         }
-    })
+    }
+
+# Live recognition over a WebSocket (needs flask-sock).
+# Client -> server: a JSON text message with session_id / section /
+# enable_hand_detection (any time), then binary frames: a 4-byte big-endian
+# frame id followed by the JPEG bytes. The stream gets its own session id
+# unless the config names one; "session_id": null turns tracking off, like
+# leaving it out of an /api/recognize_face request.
+# Server -> client: the /api/recognize_face payload plus frame_id and
+# dropped_frames. Only the newest frame is kept while one is being processed.
+# A frame that fails (e.g. the engine is still loading) gets an error payload
+# and the stream stays open; a config that isn't a JSON object closes it.
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/recognize')
+    def recognize_stream(ws):
+        options = {'session_id': str(uuid.uuid4()), 'section': None, 'enable_hand_detection': True}
+        pending = {'message': None, 'dropped': 0, 'closed': False, 'error': None}
+        pending_cond = threading.Condition()
+
+        def receive_frames():
+            try:
+                while True:
+                    message = ws.receive()
+                    with pending_cond:
+                        if isinstance(message, str):
+                            try:
+                                config = json.loads(message)
+                            except ValueError as e:
+                                pending['error'] = f'Invalid config message: {e}'
+                                return
+                            if not isinstance(config, dict):
+                                pending['error'] = 'Invalid config message: expected a JSON object'
+                                return
+                            if 'session_id' in config:
+                                options['session_id'] = config['session_id'] or None
+                            options['section'] = config.get('section') or None
+                            options['enable_hand_detection'] = config.get('enable_hand_detection', True)
+                            continue
+                        if pending['message'] is not None:
+                            pending['dropped'] += 1
+                        pending['message'] = message
+                        pending_cond.notify()
+            except Exception:
+                pass  # connection closed
+            finally:
+                with pending_cond:
+                    pending['closed'] = True
+                    pending_cond.notify()
+
+        threading.Thread(target=receive_frames, name='ws-recognize-reader', daemon=True).start()
+
+        while True:
+            with pending_cond:
+                while pending['message'] is None and not pending['closed']:
+                    pending_cond.wait()
+                if pending['closed']:
+                    error = pending['error']
+                    break
+                message, pending['message'] = pending['message'], None
+                frame_options = dict(options)
+                dropped = pending['dropped']
+
+            try:
+                frame = None
+                if len(message) > 4:
+                    frame, frame_scale = face_system.decode_frame(np.frombuffer(message, np.uint8, offset=4),
+                                                                  frame_options['session_id'])
+                if frame is None:
+                    payload = {'success': False, 'message': 'Failed to decode image'}
+                else:
+                    payload = recognition_payload(frame, frame_options['section'], frame_options['session_id'],
+                                                  frame_options['enable_hand_detection'], frame_scale)
+            except FaceEngineNotReady as e:
+                payload = engine_not_ready_payload(e)
+            except Exception as e:
+                print(f"[WS] Recognition failed: {e}")
+                payload = {'success': False, 'error': str(e), 'message': f'Recognition failed: {e}'}
+            payload['frame_id'] = struct.unpack('>I', message[:4])[0] if len(message) >= 4 else None
+            payload['dropped_frames'] = dropped + payload.get('dropped_frames', 0)
+            ws.send(app.json.dumps(payload))
+
+        if error:
+            ws.send(app.json.dumps({'success': False, 'error': error, 'message': error}))
+            ws.close(reason=1008, message=error[:120])
+else:
+    print("[WS] flask-sock not installed; /ws/recognize streaming is disabled")
 
 @app.route('/api/clear_tracking', methods=['POST'])
 def clear_tracking():
@@ -2074,15 +2300,18 @@ def clear_tracking():
     if not session_id:
         return jsonify({'success': False, 'message': 'Session ID is required'})
     
-    with system_lock:
-        result = face_system.clear_session_tracking(session_id)
+    result = face_system.clear_session_tracking(session_id)
     
     return jsonify(result)
 
+@app.route('/api/tracking_stats', methods=['GET'])
+def get_tracking_stats():
+    """Live session counts and eviction counters for the tracking registries."""
+    return jsonify(face_system.get_session_stats())
+
 @app.route('/api/database_stats', methods=['GET'])
 def get_database_stats():
-    with system_lock:
-        stats = face_system.get_database_stats()
+    stats = face_system.get_database_stats()
     
     return jsonify(stats)
 
@@ -2092,8 +2321,7 @@ def get_section_persons():
     if not section_name:
         return jsonify({'success': False, 'message': 'Section name is required'})
     
-    with system_lock:
-        persons = face_system.get_section_persons(section_name)
+    persons = face_system.get_section_persons(section_name)
     
     return jsonify({
         'success': True,
@@ -2110,8 +2338,7 @@ def delete_section():
     if not section_name:
         return jsonify({'success': False, 'message': 'Section name is required'})
     
-    with system_lock:
-        result = face_system.delete_section(section_name)
+    result = face_system.delete_section(section_name)
     
     return jsonify(result)
 
@@ -2136,8 +2363,7 @@ def close_modal():
     if not session_id or not track_id:
         return jsonify({'success': False, 'message': 'Session ID and Track ID are required'})
     
-    with system_lock:
-        result = face_system.close_modal(session_id, track_id)
+    result = face_system.close_modal(session_id, track_id)
     
     return jsonify(result)
 
@@ -2214,6 +2440,7 @@ def mark_attendance():
         )
         
         db.session.add(new_attendance)
+        apply_attendance_rollup(student.id, status)
         db.session.commit()
         
         return jsonify({
@@ -2398,8 +2625,6 @@ def get_students_by_section(section_name):
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
-        
         print("🚀 Starting Flask application...")
         print("📷 Camera will initialize only when needed (face enrollment or recognition)")
         
@@ -2407,19 +2632,22 @@ if __name__ == "__main__":
         all_sections = get_all_sections_with_defaults()
         print(f"📊 All sections in database: {all_sections}")
         
-        # Create default sections if they don't exist
-        with system_lock:
+        # Create sections once the face engine has loaded (it loads in the background)
+        def create_face_sections(system):
+            # Create default sections if they don't exist
             for section in DEFAULT_SECTIONS:
-                face_system.create_section(section)
+                system.create_section(section)
                 print(f"✅ Created section in face system: {section}")
-            
+                
             # Also add sections from teachers
             for section in all_sections:
                 if section not in DEFAULT_SECTIONS:
                     try:
-                        face_system.create_section(section)
+                        system.create_section(section)
                         print(f"✅ Added teacher section to face system: {section}")
                     except Exception as e:
                         print(f"⚠️ Section {section} may already exist: {e}")
+        
+        face_system.when_ready(create_face_sections)
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
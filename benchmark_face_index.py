@@ -0,0 +1,99 @@
+"""
+Benchmark the approximate face index against exact gallery search.
+Run: python benchmark_face_index.py [--size 50000] [--queries 500] [--db face_database.pkl | face_database_store]
+"""
+
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+import numpy as np
+from face_index import create_index, INDEX_BACKENDS, FAISS_AVAILABLE, HNSWLIB_AVAILABLE
+from face_store import read_face_database
+
+
+def load_gallery(args, rng):
+    if args.db:
+        # A store directory, or a face_database.pkl next to its <name>_store directory
+        if os.path.isdir(args.db):
+            face_database = read_face_database(args.db)
+        else:
+            face_database = read_face_database(os.path.splitext(args.db)[0] + '_store', args.db)
+        if face_database is None:
+            sys.exit(f"❌ No face database at {args.db}")
+        keys, vectors = [], []
+        for section_name, section_data in face_database['sections'].items():
+            for person_id, data in section_data.items():
+                if data.get('avg_embedding') is not None:
+                    keys.append((section_name, person_id))
+                    vectors.append(data['avg_embedding'])
+        return keys, np.vstack(vectors).astype(np.float32)
+
+    # Synthetic identities grouped around a few hundred "look-alike" directions
+    centers = rng.normal(size=(max(1, args.size // 200), args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), args.size)] + rng.normal(size=(args.size, args.dim)).astype(np.float32)
+    keys = [(f"section_{i // 40}", f"person_{i}") for i in range(args.size)]
+    return keys, vectors
+
+
+def normalize(vectors):
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.6)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--db', default=None, help='benchmark against a real face database (store directory or face_database.pkl)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    keys, vectors = load_gallery(args, rng)
+    vectors = normalize(vectors)
+
+    picked = rng.integers(0, len(keys), args.queries)
+    queries = normalize(vectors[picked] + args.noise * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32) / np.sqrt(vectors.shape[1]))
+
+    print("=" * 70)
+    print(f"FACE INDEX BENCHMARK - {len(keys)} identities, {args.queries} queries")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    exact = np.argmax(queries @ vectors.T, axis=1)
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+    exact_keys = [keys[i] for i in exact]
+    print(f"\nexact    : {exact_ms:8.3f} ms/query   recall@1 = 1.000")
+
+    backends = ['numpy']
+    if FAISS_AVAILABLE:
+        backends.append('faiss')
+    if HNSWLIB_AVAILABLE:
+        backends.append('hnswlib')
+
+    for backend in backends:
+        params = {'nprobe': args.nprobe} if backend in ('numpy', 'faiss') else {}
+        index = create_index(backend, dim=vectors.shape[1], **params)
+
+        start = time.perf_counter()
+        index.add(keys, vectors)
+        build_s = time.perf_counter() - start
+
+        # Single-query latency is what the per-frame path sees
+        start = time.perf_counter()
+        results = [index.search_batch(q)[0] for q in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        hits = sum(1 for found, expected in zip(results, exact_keys) if found and found[0][0] == expected)
+        print(f"{backend:9s}: {ann_ms:8.3f} ms/query   recall@1 = {hits / args.queries:.3f}   build = {build_s:.1f}s")
+
+    if len(backends) < len(INDEX_BACKENDS):
+        print("\n(install faiss-cpu or hnswlib to benchmark the optional backends)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+# face_store.py - Memory-mapped face embedding store
+#
+# Layout of a store directory:
+#   index.json              section/person metadata plus row offsets
+#   <block>_avg.npy         (persons x 512) float32 avg_embeddings for one section
+#   <block>_samples.npy     (samples x 512) float32 raw registration embeddings
+#
+# Embedding blocks are opened with np.load(mmap_mode='r'), so loading is just
+# parsing index.json and the raw samples are only paged in when read. Blocks
+# are never overwritten: each save writes a new generation and index.json is
+# swapped in afterwards, so a crash never leaves the index pointing at a
+# half-written block (and Windows never has to replace a mapped file).
+#
+# Between snapshots, registrations and deletions are appended to journal.log
+# (one JSON event per line) and replayed on load.
+import base64
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+
+import numpy as np
+
+INDEX_FILE = 'index.json'
+JOURNAL_FILE = 'journal.log'
+STORE_VERSION = 1
+
+
+def _atomic_write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_npy(path, array):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class EmbeddingStore:
+    """Stores face_database as a JSON index plus per-section .npy embedding blocks."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+        self.index = {'version': STORE_VERSION, 'section_list': [], 'sections': {}}
+        self.stale_blocks = []
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    @staticmethod
+    def _block_name(section_name, generation):
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', section_name)[:40]
+        digest = hashlib.sha1(section_name.encode('utf-8')).hexdigest()[:10]
+        return f"{safe}_{digest}_g{generation}"
+
+    def _block_path(self, block, kind):
+        return os.path.join(self.store_dir, f"{block}_{kind}.npy")
+
+    def load(self):
+        """Return a face_database dict whose embeddings are read-only memmap views."""
+        with open(self.index_path) as f:
+            self.index = json.load(f)
+
+        face_database = {'sections': {}, 'section_list': list(self.index['section_list']), 'id_map': {}}
+
+        for section_name in self.index['section_list']:
+            section_index = self.index['sections'][section_name]
+            section_data = {}
+            face_database['sections'][section_name] = section_data
+
+            if not section_index['persons']:
+                continue
+
+            block = section_index['block']
+            avg_block = np.load(self._block_path(block, 'avg'), mmap_mode='r')
+            sample_block = np.load(self._block_path(block, 'samples'), mmap_mode='r')
+
+            for person_id, person in section_index['persons'].items():
+                start = person['sample_start']
+                section_data[person_id] = {
+                    'name': person['name'],
+                    'id_number': person['id_number'],
+                    'embeddings': sample_block[start:start + person['sample_count']],
+                    'avg_embedding': avg_block[person['avg_row']],
+                    'metadata': person['metadata']
+                }
+                if person['id_number']:
+                    face_database['id_map'][person['id_number']] = {
+                        'section': section_name,
+                        'person_id': person_id
+                    }
+
+        return face_database
+
+    def save_section(self, face_database, section_name):
+        """Rewrite one section's embedding blocks; a no-op delete if the section is gone."""
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        old_index = self.index['sections'].get(section_name)
+        if old_index and old_index['persons']:
+            self.stale_blocks.append(old_index['block'])
+
+        if section_name not in face_database['sections']:
+            self.index['sections'].pop(section_name, None)
+            return
+
+        section_data = face_database['sections'][section_name]
+        generation = old_index.get('generation', 0) + 1 if old_index else 1
+        block = self._block_name(section_name, generation)
+        persons = {}
+        avg_rows = []
+        sample_blocks = []
+        sample_start = 0
+
+        for person_id, data in section_data.items():
+            samples = np.asarray(data['embeddings'], dtype=np.float32).reshape(-1, 512)
+            persons[person_id] = {
+                'name': data['name'],
+                'id_number': data.get('id_number'),
+                'metadata': _to_json(data.get('metadata', {})),
+                'avg_row': len(avg_rows),
+                'sample_start': sample_start,
+                'sample_count': len(samples)
+            }
+            avg_rows.append(np.asarray(data['avg_embedding'], dtype=np.float32))
+            sample_blocks.append(samples)
+            sample_start += len(samples)
+
+        if persons:
+            _atomic_save_npy(self._block_path(block, 'avg'), np.vstack(avg_rows))
+            _atomic_save_npy(self._block_path(block, 'samples'), np.vstack(sample_blocks))
+
+        self.index['sections'][section_name] = {'block': block, 'generation': generation, 'persons': persons}
+
+    def save_index(self, face_database):
+        for section_name in face_database['sections']:
+            self.index['sections'].setdefault(
+                section_name, {'block': self._block_name(section_name, 0), 'generation': 0, 'persons': {}}
+            )
+        for section_name in list(self.index['sections']):
+            if section_name not in face_database['sections']:
+                if self.index['sections'][section_name]['persons']:
+                    self.stale_blocks.append(self.index['sections'][section_name]['block'])
+                del self.index['sections'][section_name]
+
+        self.index['version'] = STORE_VERSION
+        self.index['section_list'] = list(face_database['section_list'])
+        os.makedirs(self.store_dir, exist_ok=True)
+        _atomic_write_json(self.index_path, self.index)
+        self._remove_stale_blocks()
+
+    def _remove_stale_blocks(self):
+        remaining = []
+        for block in self.stale_blocks:
+            for kind in ('avg', 'samples'):
+                path = self._block_path(block, kind)
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    # Still memory-mapped somewhere (Windows); retry on the next save
+                    remaining.append(block)
+        self.stale_blocks = list(dict.fromkeys(remaining))
+
+    def save(self, face_database, changed_sections=None):
+        """Persist changed sections (all of them if None), then the index.
+
+        Block files are written before index.json is swapped in, so a crash
+        mid-save leaves the previous index pointing at complete blocks.
+        """
+        if changed_sections is None:
+            changed_sections = list(face_database['sections'].keys())
+        for section_name in changed_sections:
+            self.save_section(face_database, section_name)
+        self.save_index(face_database)
+
+
+def migrate_pickle(pickle_path, store_dir):
+    """One-shot conversion of a legacy face_database.pkl into an EmbeddingStore."""
+    with open(pickle_path, 'rb') as f:
+        face_database = pickle.load(f)
+
+    face_database.setdefault('section_list', list(face_database['sections'].keys()))
+    store = EmbeddingStore(store_dir)
+    store.save(face_database)
+
+    persons = sum(len(section_data) for section_data in face_database['sections'].values())
+    return {'sections': len(face_database['sections']), 'persons': persons}
+
+
+def _encode_array(array):
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return {'shape': list(array.shape), 'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def _decode_array(encoded):
+    return np.frombuffer(base64.b64decode(encoded['data']), dtype=np.float32).reshape(encoded['shape'])
+
+
+def create_section_event(section_name):
+    return {'op': 'create_section', 'section': section_name}
+
+
+def delete_section_event(section_name):
+    return {'op': 'delete_section', 'section': section_name}
+
+
+def register_event(section_name, person_id, person):
+    return {
+        'op': 'register',
+        'section': section_name,
+        'person_id': person_id,
+        'name': person['name'],
+        'id_number': person.get('id_number'),
+        'metadata': _to_json(person.get('metadata', {})),
+        'embeddings': _encode_array(np.asarray(person['embeddings'], dtype=np.float32).reshape(-1, 512)),
+        'avg_embedding': _encode_array(person['avg_embedding'])
+    }
+
+
+def apply_event(face_database, event):
+    """Apply one journal event. Every event is idempotent, so replaying is safe."""
+    section_name = event['section']
+    sections = face_database['sections']
+
+    if event['op'] == 'create_section':
+        sections.setdefault(section_name, {})
+
+    elif event['op'] == 'delete_section':
+        for data in sections.pop(section_name, {}).values():
+            face_database['id_map'].pop(data.get('id_number'), None)
+
+    elif event['op'] == 'register':
+        embeddings = _decode_array(event['embeddings'])
+        sections.setdefault(section_name, {})[event['person_id']] = {
+            'name': event['name'],
+            'id_number': event['id_number'],
+            'embeddings': list(embeddings),
+            'avg_embedding': _decode_array(event['avg_embedding']),
+            'metadata': event['metadata']
+        }
+        if event['id_number']:
+            face_database['id_map'][event['id_number']] = {
+                'section': section_name,
+                'person_id': event['person_id']
+            }
+
+    face_database['section_list'] = list(sections.keys())
+
+
+class RegistrationJournal:
+    """Append-only log of face database changes since the last snapshot.
+
+    compaction rotates journal.log to journal.log.compacting, writes the
+    snapshot, then deletes the rotated file. Load replays both files, so a
+    crash at any point only means some events get (idempotently) replayed.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, JOURNAL_FILE)
+        self.compacting_path = f"{self.path}.compacting"
+        self.handle = None
+        self.pending = 0
+
+    def append(self, event):
+        if self.handle is None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            self.handle = open(self.path, 'ab')
+        self.handle.write(json.dumps(event).encode('utf-8') + b'\n')
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.pending += 1
+
+    def _read_events(self, path):
+        if not os.path.exists(path):
+            return []
+        events = []
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # Torn final write from a crash; everything before it is intact
+                    break
+        return events
+
+    def events(self):
+        """Journaled events not yet in a snapshot, oldest first (read-only)."""
+        return self._read_events(self.compacting_path) + self._read_events(self.path)
+
+    def _repair_tail(self, path):
+        # Drop a torn final line so the next append starts on a clean line
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def replay(self, face_database):
+        """Apply journaled events to a freshly loaded snapshot; returns the events."""
+        self._repair_tail(self.compacting_path)
+        self._repair_tail(self.path)
+        events = self.events()
+        for event in events:
+            apply_event(face_database, event)
+        self.pending = len(events)
+        return events
+
+    def has_pending(self):
+        return self.pending > 0 or os.path.exists(self.compacting_path)
+
+    def rotate(self):
+        """Move the live journal aside for compaction; new events go to a fresh file."""
+        self.close()
+        if os.path.exists(self.path):
+            if os.path.exists(self.compacting_path):
+                # A previous compaction never finished; fold both into one file,
+                # after dropping any torn line that would hide what follows it
+                self._repair_tail(self.compacting_path)
+                with open(self.compacting_path, 'ab') as dst, open(self.path, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+        self.pending = 0
+
+    def finish_compaction(self):
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+def read_face_database(store_dir, pickle_path=None):
+    """The face_database load() plus journal replay would give, without touching any file.
+
+    For tools that read the store while the app may be writing to it. Falls
+    back to the legacy pickle if the store has no index yet; None if there
+    is no face database at all.
+    """
+    store = EmbeddingStore(store_dir)
+    events = RegistrationJournal(store_dir).events()
+
+    if store.exists():
+        face_database = store.load()
+    elif pickle_path and os.path.exists(pickle_path):
+        with open(pickle_path, 'rb') as f:
+            face_database = pickle.load(f)
+        face_database.setdefault('id_map', {})
+    elif events:
+        face_database = {'sections': {}, 'section_list': [], 'id_map': {}}
+    else:
+        return None
+
+    for event in events:
+        apply_event(face_database, event)
+    return face_database
+
+
+def count_persons(store_dir, pickle_path=None):
+    """Registered persons as load() plus journal replay would see them, without reading embeddings.
+
+    Starts from index.json (or the legacy pickle if the store has no index
+    yet), so registrations still waiting for compaction are counted too.
+    Returns None if there is no face database at all.
+    """
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    journal = RegistrationJournal(store_dir)
+    events = journal.events()
+
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        sections = {name: set(section['persons']) for name, section in index['sections'].items()}
+    elif pickle_path and os.path.exists(pickle_path):
+        with open(pickle_path, 'rb') as f:
+            face_database = pickle.load(f)
+        sections = {name: set(section_data) for name, section_data in face_database.get('sections', {}).items()}
+    elif events:
+        sections = {}
+    else:
+        return None
+
+    for event in events:
+        if event['op'] == 'create_section':
+            sections.setdefault(event['section'], set())
+        elif event['op'] == 'delete_section':
+            sections.pop(event['section'], None)
+        elif event['op'] == 'register':
+            sections.setdefault(event['section'], set()).add(event['person_id'])
+
+    return sum(len(persons) for persons in sections.values())
@@ -0,0 +1,43 @@
+"""
+One-shot Migration - face_database.pkl to the memory-mapped embedding store
+Writes face_database_store/ (index.json + .npy embedding blocks) next to the pickle.
+The pickle is left in place as a backup.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+from face_store import EmbeddingStore, migrate_pickle
+
+# Path to your face database
+PICKLE_PATH = 'face_database.pkl'
+STORE_DIR = os.path.splitext(PICKLE_PATH)[0] + '_store'
+
+def migrate_face_database():
+    """Convert the legacy pickle into the embedding store"""
+
+    if not os.path.exists(PICKLE_PATH):
+        print(f"❌ Face database not found at: {PICKLE_PATH}")
+        print("💡 Make sure you're running this from the EduTrack directory")
+        return
+
+    if EmbeddingStore(STORE_DIR).exists():
+        print(f"⚠️  Embedding store already exists at: {STORE_DIR}")
+        print("💡 Delete it first if you want to migrate again")
+        return
+
+    try:
+        counts = migrate_pickle(PICKLE_PATH, STORE_DIR)
+
+        print("✅ Face database migrated successfully!")
+        print(f"📋 Store: {STORE_DIR}")
+        print(f"   - {counts['sections']} section(s)")
+        print(f"   - {counts['persons']} person(s)")
+        print(f"\n💡 {PICKLE_PATH} was kept as a backup and is no longer written")
+
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+
+if __name__ == "__main__":
+    migrate_face_database()
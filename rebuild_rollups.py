@@ -0,0 +1,43 @@
+"""
+Rebuild the analytics rollup tables from the raw Attendance and Score rows
+(student_attendance_rollup and student_subject_rollup).
+The routes keep them up to date on write; run this after importing data or
+editing the attendance/score tables by hand.
+Run: python rebuild_rollups.py
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+from flask import Flask
+from Sub_app.models import db, rebuild_rollups
+
+app = Flask(__name__)
+
+# Use single database at project root
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DATABASE_PATH = os.path.join(BASE_DIR, 'instance', 'smartclassroom.db')
+app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE_PATH}"
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+db.init_app(app)
+
+if __name__ == "__main__":
+    if not os.path.exists(DATABASE_PATH):
+        print(f"❌ Database not found at: {DATABASE_PATH}")
+        sys.exit(1)
+
+    with app.app_context():
+        # Creates the rollup tables if this database predates them
+        db.create_all()
+        try:
+            counts = rebuild_rollups()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error: {str(e)}")
+            sys.exit(1)
+
+        print("✅ Rollup tables rebuilt!")
+        print(f"   - {counts['students']} student attendance row(s)")
+        print(f"   - {counts['student_subjects']} student/subject score row(s)")
@@ -1611,6 +1611,7 @@ function initViewButtons() {
       aiInsightBox.innerHTML = `<p class="text-gray-500 italic">✨ Generating AI feedback...</p>`;
 
       const payload = {
+        student_id: card.dataset.studentId,
         name: card.dataset.name || "Student",
         attendance: parseFloat(card.dataset.attendance || 0),
         subjects: subjectScores
@@ -0,0 +1,149 @@
+"""
+Analytics cache check - get_student_analytics is served from the cache until
+a student, attendance or score write is committed, and never returns stale data,
+even when the write comes from another process using the same database.
+Run: python test_analytics_cache.py
+"""
+
+import sys
+import os
+import subprocess
+import tempfile
+from datetime import date
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+from flask import Flask
+from sqlalchemy import event
+from Sub_app.models import (db, Student, Attendance, Score, analytics_cache,
+                            get_student_analytics, compute_student_analytics, apply_score_rollup,
+                            apply_attendance_rollup, rebuild_rollups)
+
+OTHER_PROCESS_WRITE = f"""
+import sys
+sys.path.insert(0, {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SmartC')!r})
+from flask import Flask
+from Sub_app.models import db, Score, apply_score_rollup
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + sys.argv[1]
+db.init_app(app)
+with app.app_context():
+    score = Score(student_id="S0", subject="Music", points=88)
+    db.session.add(score)
+    apply_score_rollup(score)
+    db.session.commit()
+"""
+
+
+def main():
+    app = Flask(__name__)
+    database_path = os.path.join(tempfile.mkdtemp(), "analytics_cache.db")
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    analytics_cache.configure(max_entries=4)
+
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    with app.app_context():
+        db.create_all()
+        students = [Student(first_name=f"First{i}", last_name=f"Last{i}", student_id=f"S{i}",
+                            email=f"s{i}@school.test", date_of_birth=date(2008, 1, 1), gender="Female",
+                            grade_level="11", section="Newton", guardian_name="Guardian", guardian_contact="000")
+                    for i in range(3)]
+        db.session.add_all(students)
+        db.session.flush()
+        db.session.add(Attendance(student_id=students[0].id, date=date(2025, 6, 2), status="Present"))
+        db.session.add(Score(student_id="S0", subject="Math", points=80))
+        db.session.commit()
+        rebuild_rollups()
+
+        statements = [0]
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        def fresh():
+            return get_student_analytics() == compute_student_analytics()
+
+        print("=" * 70)
+        print("get_student_analytics CACHE")
+        print("=" * 70)
+
+        get_student_analytics()
+        statements[0] = 0
+        first = get_student_analytics()
+        check("Repeated call only reads the generation", statements[0] == 1)
+
+        first[0]["subject_scores"]["Math"] = -1
+        check("Mutating a result doesn't change the cache", get_student_analytics()[0]["subject_scores"]["Math"] != -1)
+
+        get_student_analytics(grade="11")
+        statements[0] = 0
+        get_student_analytics(grade="11")
+        check("Each filter set has its own entry", statements[0] == 1)
+
+        score = Score(student_id="S1", subject="Science", points=90)
+        db.session.add(score)
+        apply_score_rollup(score)
+        db.session.commit()
+        check("New score invalidates", fresh())
+
+        record = Attendance(student_id=students[1].id, date=date(2025, 6, 2), status="Late")
+        db.session.add(record)
+        apply_attendance_rollup(students[1].id, record.status)
+        db.session.commit()
+        check("New attendance invalidates", fresh())
+
+        students[2].section = "Tesla"
+        db.session.commit()
+        check("Student edit invalidates", get_student_analytics(section="Tesla") == compute_student_analytics(section="Tesla")
+              and fresh())
+
+        Score.query.filter_by(student_id="S0").update({"points": 20})
+        rebuild_rollups()
+        check("Bulk update and rollup rebuild invalidate", fresh())
+
+        cached = get_student_analytics()
+        db.session.add(Score(student_id="S2", subject="Math", points=50))
+        db.session.rollback()
+        statements[0] = 0
+        check("Rolled-back write keeps the entry", get_student_analytics() == cached and statements[0] == 1)
+
+        score = Score(student_id="S2", subject="Art", points=70)
+        db.session.add(score)
+        apply_score_rollup(score)
+        uncommitted = get_student_analytics()
+        db.session.rollback()
+        check("Uncommitted writes are visible but never cached",
+              "Art" in uncommitted[2]["subject_scores"] and "Art" not in get_student_analytics()[2]["subject_scores"]
+              and fresh())
+
+        # Another app/worker process: its write must invalidate this process's cache
+        get_student_analytics()
+        db.session.commit()
+        subprocess.run([sys.executable, "-c", OTHER_PROCESS_WRITE, database_path], check=True)
+        check("Write from another process invalidates", "Music" in get_student_analytics()[0]["subject_scores"]
+              and fresh())
+
+        for grade in ("9", "10", "12", "13", "14"):
+            get_student_analytics(grade=grade)
+        check("Entries are bounded", analytics_cache.stats()["entries"] == 4)
+
+        analytics_cache.enabled = False
+        statements[0] = 0
+        get_student_analytics()
+        check("Disabled cache always computes", statements[0] > 0)
+
+        print(f"\nStats: {analytics_cache.stats()}")
+        print()
+        if failures:
+            print(f"❌ {failures} check(s) failed")
+            sys.exit(1)
+        print("✅ Cache hits and invalidation behave")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Parity check - set-based get_student_analytics vs the old per-student queries
+Seeds an in-memory database, compares both for every filter combination and
+counts the SQL statements each one issues. Also checks that the rollup tables
+kept up to date on write match a full rebuild, and that get_student_analytics_for
+matches the full result for every student, that the /quick-stats class
+score figures match the raw scores, that analytics still match
+on a database whose rollup tables are missing or not yet backfilled, and that
+workers starting together backfill them only once.
+Run: python test_analytics_parity.py [--students 300]
+"""
+
+import sys
+import os
+import random
+import argparse
+import subprocess
+import tempfile
+from datetime import date, timedelta
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+from flask import Flask
+from sqlalchemy import event, func
+from Sub_app.models import (db, Student, Attendance, Score, StudentAttendanceRollup, StudentSubjectRollup,
+                            get_student_analytics, get_student_analytics_for, apply_attendance_rollup, apply_score_rollup, rebuild_rollups,
+                            compute_student_analytics, ensure_rollups, rollups_ready, class_score_stats)
+import Sub_app.models as models
+
+GRADES = ["10", "11", "12"]
+SECTIONS = ["Newton", "Einstein", "Tesla"]
+SUBJECTS = ["Math", "Science", "English", "History"]
+STATUSES = ["Present", "Present", "Present", "Absent", "Late", "Excused"]
+
+# What main.py does at import in every worker
+WORKER_STARTUP = f"""
+import sys
+sys.path.insert(0, {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SmartC')!r})
+from flask import Flask
+from Sub_app.models import db, ensure_rollups
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + sys.argv[1]
+db.init_app(app)
+with app.app_context():
+    db.create_all()
+    print("rebuilt" if ensure_rollups() else "skipped")
+"""
+
+
+def legacy_get_student_analytics(grade="", section="", subject="", score_weight=0.7, attendance_weight=0.3):
+    """The previous implementation: ~20 queries per student."""
+    students_data = []
+
+    query = Student.query
+    if grade:
+        query = query.filter(Student.grade_level == grade)
+    if section:
+        query = query.filter(Student.section == section)
+
+    for student in query.all():
+        attendance_query = Attendance.query.filter_by(student_id=student.id)
+        total_days = attendance_query.count()
+        present_days = attendance_query.filter_by(status="Present").count()
+        absent_count = attendance_query.filter_by(status="Absent").count()
+        late_count = attendance_query.filter_by(status="Late").count()
+        attendance_percentage = round((present_days / total_days) * 100, 2) if total_days > 0 else 0
+
+        if subject:
+            subjects_to_query = [subject]
+        else:
+            subjects_to_query = [s.subject for s in db.session.query(Score.subject)
+                                 .filter_by(student_id=student.student_id)
+                                 .distinct()]
+
+        subject_score_dict = {}
+        raw_subject_scores = {}
+        subject_totals = {}
+        subject_counts = {}
+
+        for subj in subjects_to_query:
+            avg_score = db.session.query(func.avg(Score.points))\
+                .filter_by(student_id=student.student_id, subject=subj)\
+                .scalar()
+            avg_score = round(avg_score or 0, 2)
+            total_score = db.session.query(func.sum(Score.points))\
+                .filter_by(student_id=student.student_id, subject=subj)\
+                .scalar()
+            total_score = total_score or 0
+            score_count = db.session.query(func.count(Score.id))\
+                .filter_by(student_id=student.student_id, subject=subj)\
+                .scalar()
+            score_count = score_count or 0
+
+            weighted_score = round((avg_score * score_weight) + (attendance_percentage * attendance_weight), 2)
+
+            subject_score_dict[subj] = weighted_score
+            raw_subject_scores[subj] = avg_score
+            subject_totals[subj] = total_score
+            subject_counts[subj] = score_count
+
+        if subject_score_dict:
+            overall_avg = round(sum(subject_score_dict.values()) / len(subject_score_dict), 2)
+        else:
+            overall_avg = 0
+
+        students_data.append({
+            "student_id": student.student_id,
+            "first_name": student.first_name,
+            "middle_initial": student.middle_initial,
+            "last_name": student.last_name,
+            "grade_level": student.grade_level,
+            "section": student.section,
+            "attendance": attendance_percentage,
+            "present_count": present_days,
+            "absent_count": absent_count,
+            "late_count": late_count,
+            "average_score": overall_avg,
+            "image": student.image,
+            "subject_scores": subject_score_dict,
+            "raw_subject_scores": raw_subject_scores,
+            "subject_totals": subject_totals,
+            "subject_counts": subject_counts,
+        })
+
+    return students_data
+
+
+def seed(num_students, rng):
+    students = []
+    for i in range(num_students):
+        students.append(Student(
+            first_name=f"First{i}", middle_initial=rng.choice([None, "A", "B"]), last_name=f"Last{i}",
+            student_id=f"S{i:05d}", email=f"s{i}@school.test", date_of_birth=date(2008, 1, 1),
+            gender=rng.choice(["Male", "Female"]), grade_level=rng.choice(GRADES),
+            section=rng.choice(SECTIONS), guardian_name="Guardian", guardian_contact="000"
+        ))
+    db.session.add_all(students)
+    db.session.flush()
+
+    start = date(2025, 6, 1)
+    for student in students:
+        # Some students have no attendance and/or no scores at all
+        if rng.random() > 0.1:
+            for day in range(rng.randint(1, 40)):
+                db.session.add(Attendance(student_id=student.id, date=start + timedelta(days=day),
+                                          status=rng.choice(STATUSES)))
+        if rng.random() > 0.1:
+            for _ in range(rng.randint(1, 30)):
+                db.session.add(Score(student_id=student.student_id, subject=rng.choice(SUBJECTS),
+                                     points=rng.randint(0, 100)))
+    db.session.commit()
+
+
+def write_through_routes(rng, count):
+    """The same writes the routes make: new attendance, status changes and new scores."""
+    students = Student.query.all()
+    for _ in range(count):
+        student = rng.choice(students)
+        action = rng.random()
+        if action < 0.3:
+            record = Attendance(student_id=student.id, date=date(2026, 1, 1) + timedelta(days=rng.randint(0, 300)),
+                                status=rng.choice(STATUSES + ["present"]))
+            db.session.add(record)
+            apply_attendance_rollup(student.id, record.status)
+        elif action < 0.6:
+            record = Attendance.query.filter_by(student_id=student.id).first()
+            if record:
+                status = rng.choice(STATUSES)
+                if record.status != status:
+                    apply_attendance_rollup(student.id, status, old_status=record.status)
+                    record.status = status
+        else:
+            score = Score(student_id=student.student_id, subject=rng.choice(SUBJECTS + ["Art"]),
+                          points=rng.randint(0, 100))
+            db.session.add(score)
+            apply_score_rollup(score)
+        db.session.commit()
+
+
+def rollup_snapshot():
+    return (
+        sorted((r.student_id, r.present, r.absent, r.late, r.excused, r.total)
+               for r in StudentAttendanceRollup.query),
+        sorted((r.student_id, r.subject, r.points_sum, r.points_count, r.first_score_id)
+               for r in StudentSubjectRollup.query)
+    )
+
+
+def class_score_stats_match():
+    """class_score_stats() against the raw Score rows, for every class and subject filter."""
+    matches = True
+    for grade, section in [(g, s) for g in GRADES for s in SECTIONS] + [("9", "Newton")]:
+        students = Student.query.filter_by(grade_level=grade, section=section).all()
+        codes = [student.student_id for student in students]
+        scores = Score.query.filter(Score.student_id.in_(codes)).all()
+        by_student = {}
+        for score in scores:
+            by_student.setdefault(score.student_id, []).append(score.points)
+        expected_low = sum(1 for values in by_student.values() if sum(values) / len(values) < 70)
+        for subject in [None] + SUBJECTS:
+            points = [score.points for score in scores if subject is None or score.subject == subject]
+            expected_average = round(sum(points) / len(points), 2) if points else 0
+            matches &= class_score_stats(codes, subject) == (expected_average, expected_low)
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=300)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        rng = random.Random(0)
+        seed(args.students, rng)
+        rebuild_rollups()
+        write_through_routes(rng, args.students)
+
+        maintained = rollup_snapshot()
+        rebuild_rollups()
+        rollups_match = maintained == rollup_snapshot()
+
+        statements = [0]
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        def run(fn, **filters):
+            statements[0] = 0
+            result = fn(**filters)
+            return result, statements[0]
+
+        print("=" * 70)
+        print(f"get_student_analytics PARITY - {args.students} students")
+        print("=" * 70)
+
+        cases = [{}]
+        cases += [{'grade': g} for g in GRADES]
+        cases += [{'grade': "11", 'section': s} for s in SECTIONS]
+        cases += [{'subject': s} for s in SUBJECTS + ["Art"]]
+        cases += [{'grade': "12", 'section': "Tesla", 'subject': "Math"}, {'grade': "9"}]
+        cases += [{'score_weight': 0.5, 'attendance_weight': 0.5}, {'subject': "Science", 'score_weight': 1.0, 'attendance_weight': 0.0}]
+
+        failures = 0
+        for filters in cases:
+            expected, legacy_queries = run(legacy_get_student_analytics, **filters)
+            actual, queries = run(get_student_analytics, **filters)
+            # Same values and the same dict key order (templates iterate them)
+            same = expected == actual and all(
+                list(e[key]) == list(a[key])
+                for e, a in zip(expected, actual) for key in ("subject_scores", "raw_subject_scores")
+            )
+            failures += not same
+            print(f"{'✅' if same else '❌'} {str(filters):60s} {len(actual):4d} students  "
+                  f"queries {legacy_queries:5d} -> {queries}")
+
+        print(f"{'✅' if rollups_match else '❌'} Rollups maintained on write match a full rebuild")
+        failures += not rollups_match
+
+        # /quick-stats used to filter scores by Student.id, which never equals the
+        # student_id code Score rows carry, so its average engagement was always 0
+        quick_match = class_score_stats_match() and Score.query.filter(
+            Score.student_id.in_([student.id for student in Student.query])).count() == 0
+        print(f"{'✅' if quick_match else '❌'} /quick-stats class scores match the raw scores (by student_id code)")
+        failures += not quick_match
+
+        everyone = legacy_get_student_analytics(score_weight=0.6, attendance_weight=0.4)
+        single_queries = set()
+        single_match = True
+        for expected in everyone:
+            actual, queries = run(get_student_analytics_for, student_id=expected["student_id"],
+                                  score_weight=0.6, attendance_weight=0.4)
+            single_match &= actual == expected and list(actual["subject_scores"]) == list(expected["subject_scores"])
+            single_queries.add(queries)
+        single_match &= get_student_analytics_for("missing") is None
+        print(f"{'✅' if single_match else '❌'} get_student_analytics_for matches for every student  "
+              f"queries per student {sorted(single_queries)}")
+        failures += not single_match
+
+        # An older database: no rollup tables, then empty ones, then backfilled
+        StudentAttendanceRollup.__table__.drop(db.engine)
+        StudentSubjectRollup.__table__.drop(db.engine)
+        models._rollups_ready.clear()
+        fallback_match = not rollups_ready() and all(
+            compute_student_analytics(**filters) == legacy_get_student_analytics(**filters) for filters in cases)
+        fallback_match &= class_score_stats_match()
+        db.create_all()
+        fallback_match &= not rollups_ready() and compute_student_analytics() == legacy_get_student_analytics()
+        ensure_rollups()
+        fallback_match &= rollups_ready() and compute_student_analytics() == legacy_get_student_analytics()
+        print(f"{'✅' if fallback_match else '❌'} Raw aggregates used until the rollup tables exist and are backfilled")
+        failures += not fallback_match
+
+    # Several workers importing main.py at once on a database without rollups
+    workers_app = Flask(__name__)
+    database_path = os.path.join(tempfile.mkdtemp(), "workers.db")
+    workers_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    workers_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(workers_app)
+    with workers_app.app_context():
+        db.create_all()
+        seed(40, random.Random(1))
+        workers = [subprocess.Popen([sys.executable, "-c", WORKER_STARTUP, database_path],
+                                    stdout=subprocess.PIPE, text=True) for _ in range(4)]
+        outcomes = sorted(worker.communicate()[0].strip() for worker in workers)
+        backfilled = rollup_snapshot()
+        rebuild_rollups()
+        once = outcomes == ["rebuilt", "skipped", "skipped", "skipped"] and backfilled == rollup_snapshot()
+        print(f"{'✅' if once else '❌'} Workers starting together backfill the rollups once {outcomes}")
+        failures += not once
+
+        print()
+        if failures:
+            print(f"❌ {failures} case(s) differ")
+            sys.exit(1)
+        print("✅ Identical output for every case")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Dashboard data check - get_dashboard_data matches the old dashboard() assembly
+and issues the same number of queries at any class size.
+Run: python test_dashboard_data.py
+"""
+
+import sys
+import os
+import random
+from datetime import date
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+from flask import Flask
+from sqlalchemy import event
+from Sub_app.models import (db, Student, Attendance, Score, analytics_cache, rebuild_rollups,
+                            get_student_analytics, evaluate_student_status, get_dashboard_data)
+
+TODAY = date(2025, 9, 1)
+
+
+def legacy_dashboard_data(score_weight, attendance_weight):
+    """The previous dashboard() body (flags evaluated on the same weights)."""
+    raw_student = get_student_analytics(score_weight=score_weight, attendance_weight=attendance_weight)
+    student_evaluations = evaluate_student_status(analytics=get_student_analytics(
+        score_weight=score_weight, attendance_weight=attendance_weight))
+    for student in raw_student:
+        eval_data = next((e for e in student_evaluations if e['student']['student_id'] == student['student_id']), None)
+        student['flags'] = eval_data['flags'] if eval_data else []
+        student['status_info'] = eval_data['status'] if eval_data else {'overall_status': 'good'}
+
+    students = Student.query.all()
+    statuses = []
+    for s in students:
+        attendance_record = Attendance.query.filter_by(student_id=s.id, date=TODAY).first()
+        statuses.append(attendance_record.status if attendance_record else "Absent")
+    return raw_student, statuses
+
+
+def seed(start, count, rng):
+    students = [Student(first_name=f"First{i}", last_name=f"Last{i}", student_id=f"S{i:05d}",
+                        email=f"s{i}@school.test", date_of_birth=date(2008, 1, 1), gender="Male",
+                        grade_level="11", section="Newton", guardian_name="Guardian", guardian_contact="000")
+                for i in range(start, start + count)]
+    db.session.add_all(students)
+    db.session.flush()
+    for student in students:
+        if rng.random() > 0.3:
+            db.session.add(Attendance(student_id=student.id, date=TODAY, status=rng.choice(["Present", "Late"])))
+        for _ in range(rng.randint(0, 5)):
+            db.session.add(Score(student_id=student.student_id, subject=rng.choice(["Math", "English"]),
+                                 points=rng.randint(30, 100)))
+    db.session.commit()
+    rebuild_rollups()
+
+
+def main():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    analytics_cache.enabled = False
+
+    failures = 0
+    with app.app_context():
+        db.create_all()
+        rng = random.Random(0)
+        statements = [0]
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        print("=" * 70)
+        print("get_dashboard_data")
+        print("=" * 70)
+
+        counts = []
+        total = 0
+        for added in (10, 190):
+            seed(total, added, rng)
+            total += added
+            expected_raw, expected_statuses = legacy_dashboard_data(0.6, 0.4)
+
+            statements[0] = 0
+            data = get_dashboard_data(0.6, 0.4, today=TODAY)
+            counts.append(statements[0])
+
+            same = (data["raw_student"] == expected_raw
+                    and [s.status for s in data["students"]] == expected_statuses
+                    and all(s.is_present == (s.status == "Present") for s in data["students"]))
+            failures += not same
+            print(f"{'✅' if same else '❌'} {total:4d} students: same output, {statements[0]} queries")
+
+        bounded = counts[0] == counts[1]
+        failures += not bounded
+        print(f"{'✅' if bounded else '❌'} Query count doesn't grow with class size")
+
+        print()
+        if failures:
+            print(f"❌ {failures} check(s) failed")
+            sys.exit(1)
+        print("✅ Dashboard data matches with a bounded query count")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Face index check - approximate search vs exact gallery search
+For every available backend: recall@1 against brute force, removal, re-adding
+a key, and that save/load gives back the same results.
+Run: python test_face_index.py
+"""
+
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+import numpy as np
+from face_index import ANNIndex, create_index, INDEX_BACKENDS, FAISS_AVAILABLE, HNSWLIB_AVAILABLE
+
+GALLERY_SIZE = 5000
+QUERIES = 300
+MIN_RECALL = 0.95
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_gallery(rng):
+    # Look-alike clusters make the nearest neighbour non-trivial to find
+    centers = rng.normal(size=(GALLERY_SIZE // 100, 512)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), GALLERY_SIZE)] + rng.normal(size=(GALLERY_SIZE, 512)).astype(np.float32)
+    keys = [(f"section_{i // 40}", f"person_{i}") for i in range(GALLERY_SIZE)]
+    return keys, normalize(vectors)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    keys, vectors = make_gallery(rng)
+    picked = rng.integers(0, GALLERY_SIZE, QUERIES)
+    # Noisy captures of registered people; at this noise exact search itself misses ~10%
+    queries = normalize(vectors[picked] + 4.0 * rng.normal(size=(QUERIES, 512)).astype(np.float32) / np.sqrt(512))
+    exact = [keys[i] for i in np.argmax(queries @ vectors.T, axis=1)]
+
+    available = {'numpy': True, 'faiss': FAISS_AVAILABLE, 'hnswlib': HNSWLIB_AVAILABLE}
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    print("=" * 70)
+    print(f"FACE INDEX - {GALLERY_SIZE} identities, {QUERIES} queries")
+    print("=" * 70)
+
+    for backend in INDEX_BACKENDS:
+        if not available[backend]:
+            print(f"⚠️ {backend}: not installed, skipped")
+            continue
+
+        index = create_index(backend)
+        index.add(keys, vectors)
+        results = index.search_batch(queries, top_k=5)
+        recall = np.mean([bool(row) and row[0][0] == expected for row, expected in zip(results, exact)])
+        check(f"{backend}: recall@1 {recall:.3f} (min {MIN_RECALL})", recall >= MIN_RECALL)
+
+        removed = set(exact[:20])
+        index.remove(removed)
+        results = index.search_batch(queries[:20], top_k=5)
+        check(f"{backend}: removed keys are never returned",
+              len(index) == GALLERY_SIZE - len(removed) and not any(key in removed for row in results for key, _ in row))
+
+        # Re-adding a key replaces its vector
+        index.add([keys[0]], queries[:1])
+        check(f"{backend}: re-added key is found at its new vector",
+              index.search_batch(queries[:1])[0][0][0] == keys[0] and len(index) == GALLERY_SIZE - len(removed - {keys[0]}))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, "gallery_index")
+            index.save(prefix)
+            loaded = ANNIndex.load(prefix)
+            before = [[key for key, _ in row] for row in index.search_batch(queries, top_k=3)]
+            after = [[key for key, _ in row] for row in loaded.search_batch(queries, top_k=3)]
+            check(f"{backend}: save/load round trip", loaded.keys() == index.keys() and before == after)
+
+    empty = create_index('numpy')
+    check("empty index returns no matches", empty.search_batch(queries[:2]) == [[], []])
+
+    print()
+    if failures:
+        print(f"❌ {failures} check(s) failed")
+        sys.exit(1)
+    print("✅ Face index matches exact search")
+
+
+if __name__ == "__main__":
+    main()
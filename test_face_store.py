@@ -0,0 +1,213 @@
+"""
+Face store check - the memory-mapped embedding store gives back exactly what was saved
+Save/load round trip, per-section saves, section deletion and pickle migration,
+plus registration journal replay after crashes (including mid-compaction).
+Run: python test_face_store.py
+"""
+
+import sys
+import os
+import pickle
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+import numpy as np
+from face_store import (EmbeddingStore, RegistrationJournal, migrate_pickle, register_event, create_section_event,
+                        delete_section_event, apply_event, read_face_database, count_persons)
+
+
+def make_person(rng, name, samples):
+    embeddings = [rng.normal(size=512).astype(np.float32) for _ in range(samples)]
+    return {
+        'name': name,
+        'id_number': f"ID-{name}",
+        'embeddings': embeddings,
+        'avg_embedding': np.mean(embeddings, axis=0),
+        # NumPy scalars in metadata must come back as plain JSON values
+        'metadata': {'registered': '2025-06-01', 'quality': np.float32(0.5), 'samples': np.int64(samples)}
+    }
+
+
+def make_database(rng):
+    sections = {
+        'Grade 10 - Newton': {f"p{i}": make_person(rng, f"newton{i}", 1 + i % 4) for i in range(6)},
+        'Grade 11/Einstein': {f"p{i}": make_person(rng, f"einstein{i}", 2) for i in range(3)},
+        'Empty': {}
+    }
+    id_map = {person['id_number']: {'section': section_name, 'person_id': person_id}
+              for section_name, section_data in sections.items() for person_id, person in section_data.items()}
+    return {'sections': sections, 'section_list': list(sections), 'id_map': id_map}
+
+
+def same_database(expected, actual):
+    if expected['section_list'] != actual['section_list'] or expected['id_map'] != actual['id_map']:
+        return False
+    for section_name, section_data in expected['sections'].items():
+        loaded = actual['sections'][section_name]
+        if list(loaded) != list(section_data):
+            return False
+        for person_id, person in section_data.items():
+            other = loaded[person_id]
+            if (other['name'], other['id_number']) != (person['name'], person['id_number']):
+                return False
+            if other['metadata'] != {k: v.item() if hasattr(v, 'item') else v for k, v in person['metadata'].items()}:
+                return False
+            if not np.array_equal(np.asarray(other['embeddings']), np.asarray(person['embeddings'], dtype=np.float32)):
+                return False
+            if not np.array_equal(other['avg_embedding'], person['avg_embedding'].astype(np.float32)):
+                return False
+    return True
+
+
+def replayed(store_dir):
+    """What load_database sees after a restart: snapshot (if any) plus journal replay."""
+    store = EmbeddingStore(store_dir)
+    face_database = store.load() if store.exists() else {'sections': {}, 'section_list': [], 'id_map': {}}
+    RegistrationJournal(store_dir).replay(face_database)
+    return face_database
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def block_files(store_dir):
+    return sorted(name for name in os.listdir(store_dir) if name.endswith('.npy'))
+
+
+def main():
+    rng = np.random.default_rng(0)
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    print("=" * 70)
+    print("FACE EMBEDDING STORE")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, 'face_database_store')
+        face_database = make_database(rng)
+        EmbeddingStore(store_dir).save(face_database)
+
+        loaded = EmbeddingStore(store_dir).load()
+        check("Save/load round trip gives back every person, embedding and metadata", same_database(face_database, loaded))
+        check("Embeddings are loaded as memory-mapped views",
+              isinstance(loaded['sections']['Grade 11/Einstein']['p0']['avg_embedding'].base, np.memmap))
+
+        # Change one section only: its blocks are replaced, the others untouched
+        store = EmbeddingStore(store_dir)
+        store.load()
+        before = block_files(store_dir)
+        face_database['sections']['Grade 10 - Newton']['p9'] = make_person(rng, 'newton9', 3)
+        face_database['id_map']['ID-newton9'] = {'section': 'Grade 10 - Newton', 'person_id': 'p9'}
+        del loaded
+        store.save(face_database, changed_sections=['Grade 10 - Newton'])
+        after = block_files(store_dir)
+        einstein_blocks = [name for name in before if name.startswith('Grade_11_Einstein')]
+        check("Saving one section rewrites only its blocks",
+              len(after) == len(before) and all(name in after for name in einstein_blocks) and after != before)
+        check("Round trip after a section save", same_database(face_database, EmbeddingStore(store_dir).load()))
+
+        # Deleting a section drops it from the index and removes its blocks
+        for person in face_database['sections'].pop('Grade 11/Einstein').values():
+            del face_database['id_map'][person['id_number']]
+        face_database['section_list'].remove('Grade 11/Einstein')
+        store.save(face_database, changed_sections=['Grade 11/Einstein'])
+        check("Deleted section and its blocks are gone",
+              same_database(face_database, EmbeddingStore(store_dir).load())
+              and not any(name.startswith('Grade_11_Einstein') for name in block_files(store_dir)))
+
+        # Legacy pickle -> store
+        pickle_path = os.path.join(tmp, 'face_database.pkl')
+        legacy = make_database(rng)
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(legacy, f)
+        counts = migrate_pickle(pickle_path, os.path.join(tmp, 'migrated_store'))
+        check("Pickle migration round trip",
+              counts == {'sections': 3, 'persons': 9}
+              and same_database(legacy, EmbeddingStore(os.path.join(tmp, 'migrated_store')).load()))
+
+    print("=" * 70)
+    print("REGISTRATION JOURNAL")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, 'face_database_store')
+        expected = {'sections': {}, 'section_list': [], 'id_map': {}}
+
+        def write(journal, event):
+            journal.append(event)
+            apply_event(expected, event)
+
+        journal = RegistrationJournal(store_dir)
+        write(journal, create_section_event('Newton'))
+        for i in range(3):
+            write(journal, register_event('Newton', f"p{i}", make_person(rng, f"newton{i}", 2)))
+        journal.close()
+
+        # Crash mid-append: the torn last line is dropped, everything before it kept
+        with open(journal.path, 'ab') as f:
+            f.write(b'{"op": "register", "section": "New')
+        check("Replay after a torn append keeps every complete event", same_database(expected, replayed(store_dir)))
+
+        journal = RegistrationJournal(store_dir)
+        journal.replay({'sections': {}, 'section_list': [], 'id_map': {}})
+        write(journal, register_event('Newton', 'p3', make_person(rng, 'newton3', 1)))
+        journal.close()
+        check("Appends after the repair are replayed", same_database(expected, replayed(store_dir)))
+
+        # Crash mid-compaction: rotated, snapshot never written
+        journal = RegistrationJournal(store_dir)
+        journal.rotate()
+        write(journal, create_section_event('Tesla'))
+        write(journal, register_event('Tesla', 'p0', make_person(rng, 'tesla0', 3)))
+        journal.close()
+        check("Crash before the snapshot: rotated and live journals both replayed",
+              same_database(expected, replayed(store_dir)))
+
+        # The unfinished compaction file also ends in a torn line; the next rotate folds them together
+        with open(journal.compacting_path, 'ab') as f:
+            f.write(b'{"op": "regis')
+        journal = RegistrationJournal(store_dir)
+        write(journal, register_event('Tesla', 'p1', make_person(rng, 'tesla1', 1)))
+        journal.rotate()
+        write(journal, delete_section_event('Newton'))
+        journal.close()
+        check("Torn compaction file doesn't hide the events folded in after it",
+              same_database(expected, replayed(store_dir)))
+        journal_bytes = {path: read_bytes(path) for path in (journal.path, journal.compacting_path)}
+        with open(journal.compacting_path, 'ab') as f:
+            f.write(b'{"op": "regis')
+        journal_bytes[journal.compacting_path] += b'{"op": "regis'
+        check("read_face_database and count_persons see journaled changes without modifying files",
+              same_database(expected, read_face_database(store_dir)) and count_persons(store_dir) == 2
+              and all(read_bytes(path) == data for path, data in journal_bytes.items()))
+
+        # Compaction: rotate, snapshot, then delete the rotated file. A crash after
+        # the snapshot replays those events again on top of it, which is idempotent
+        journal = RegistrationJournal(store_dir)
+        journal.rotate()
+        EmbeddingStore(store_dir).save(expected)
+        check("Crash after the snapshot: events replayed again on top of it",
+              same_database(expected, replayed(store_dir)))
+
+        journal = RegistrationJournal(store_dir)
+        journal.finish_compaction()
+        check("Finished compaction leaves only the snapshot",
+              not journal.has_pending() and not os.path.exists(journal.path)
+              and same_database(expected, replayed(store_dir)))
+
+    print()
+    if failures:
+        print(f"❌ {failures} check(s) failed")
+        sys.exit(1)
+    print("✅ Embedding store and journal round trip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Face tracking check - BoxKalmanFilter prediction and SessionRegistry eviction
+Constant-velocity prediction (with noise and missed frames), FaceTracker
+keeping fast-moving faces on one track, tracks surviving a decode scale
+change, optical-flow frames (coasting tracks, unknown faces), LRU eviction past max_sessions,
+idle-time (TTL) sweeps, eviction callbacks, stats, concurrent creation and
+frames without a session_id staying out of the registry.
+Run: python test_face_tracking.py
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'SmartC'))
+
+import numpy as np
+from face_system import BoxKalmanFilter, FaceRecognitionSystem, FaceTracker, SessionRegistry
+
+
+def moving_box(frame, speed=(12.0, 3.0), size=80.0):
+    x, y = 100 + speed[0] * frame, 120 + speed[1] * frame
+    return [x, y, x + size, y + size]
+
+
+def center_error(box1, box2):
+    return float(np.hypot((box1[0] + box1[2] - box2[0] - box2[2]) / 2, (box1[1] + box1[3] - box2[1] - box2[3]) / 2))
+
+
+def bare_system(max_sessions):
+    """FaceRecognitionSystem without models: detection finds no faces, hands are off."""
+    system = object.__new__(FaceRecognitionSystem)
+    system.session_tracking = SessionRegistry('tracker', max_sessions=max_sessions, ttl=60)
+    system.active_modals = SessionRegistry('modal', max_sessions=max_sessions, ttl=60)
+    system.hand_detection_enabled = False
+    system.detect_interval = 1
+    system.det_sizes = [(640, 640)]
+    system.det_size = (640, 640)
+    system.full_det_every = 15
+    system.detect_faces = lambda frame, det_size=None: []
+    return system
+
+
+def main():
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    print("=" * 70)
+    print("KALMAN FILTER")
+    print("=" * 70)
+
+    rng = np.random.default_rng(0)
+    kf = BoxKalmanFilter(moving_box(0))
+    for frame in range(1, 15):
+        kf.predict()
+        kf.update(np.asarray(moving_box(frame)) + rng.normal(scale=1.5, size=4))
+    peeked = kf.peek()
+    check("peek() doesn't advance the filter", kf.peek() == peeked)
+    error = center_error(kf.predict(), moving_box(15))
+    check(f"Predicts the next position of a noisy constant-velocity box (off by {error:.1f}px)", error < 5)
+
+    # Missed detections: the filter keeps moving the box along its velocity
+    for frame in range(16, 19):
+        kf.predict()
+    error = center_error(kf.bbox(), moving_box(18))
+    check(f"Keeps coasting through 3 missed frames (off by {error:.1f}px)", error < 10)
+
+    # A moving face missed for two frames reappears with no overlap with where
+    # it was last seen; matching against the prediction keeps it on its track
+    tracker = FaceTracker()
+    speed = (30.0, 0.0)
+    track_ids = set()
+    for frame in range(13):
+        detections = [] if frame in (8, 9) else [{'bbox': moving_box(frame, speed), 'emb': None}]
+        tracks = tracker.update(detections)
+        track_ids.update(track['track_id'] for track in tracks)
+    raw_iou = FaceTracker.iou(moving_box(7, speed), moving_box(10, speed))
+    check(f"Face missed for 2 frames (raw IoU {raw_iou:.2f}) stays on one track", track_ids == {0})
+
+    # decode_frame() switches between full, 1/2 and 1/4 size decodes within a
+    # session; the same three faces must keep their tracks across every switch
+    tracker_data = {'tracker': FaceTracker(max_disappeared=30, iou_threshold=0.4, max_distance=0.5),
+                    'frame_scale': 1.0}
+    track_ids = set()
+    for frame, frame_scale in enumerate([1.0, 1.0, 2.0, 2.0, 4.0, 1.0, 2.0]):
+        FaceRecognitionSystem._follow_frame_scale(tracker_data, frame_scale)
+        x1, y1, x2, y2 = moving_box(frame, (4.0, 1.0))
+        detections = [{'bbox': [v / frame_scale for v in (x1 + offset, y1, x2 + offset, y2)], 'emb': None}
+                      for offset in (0, 200, 400)]
+        tracks = tracker_data['tracker'].update(detections)
+        track_ids.update(track['track_id'] for track in tracks)
+    check(f"Tracks keep their ids across decode scale changes (ids seen: {sorted(track_ids)})",
+          track_ids == {0, 1, 2} and len(tracker_data['tracker'].tracks) == 3)
+
+    # Optical-flow frames: the visible face is followed, the missing one keeps
+    # coasting on its prediction, and an unknown face doesn't force detection
+    rng = np.random.default_rng(1)
+    texture = (rng.random((240, 320)) * 255).astype(np.uint8)
+    tracker = FaceTracker()
+    for frame in range(6):
+        detections = [{'bbox': moving_box(frame, (6.0, 0.0), 60), 'emb': None}]
+        if frame < 5:
+            detections.append({'bbox': [v + 150 for v in moving_box(frame, (0.0, 6.0), 60)], 'emb': None})
+        tracker.update(detections)
+    coasting = tracker.tracks[1]['kf'].peek()
+    system = bare_system(max_sessions=4)
+    system.detect_interval = 3
+    tracker_data = {'tracker': tracker, 'prev_gray': texture, 'frames_since_detection': 0}
+    skipped = system._propagate_tracks(tracker_data, np.roll(texture, 6, axis=1))
+    check("An unrecognized face doesn't stop detection from being skipped", skipped)
+    check("Coasting tracks keep advancing on optical-flow frames",
+          tracker.tracks[1]['predicted_bbox'] == coasting and tracker.disappeared[1] == 2)
+
+    print("=" * 70)
+    print("SESSION REGISTRY")
+    print("=" * 70)
+
+    evicted = []
+    registry = SessionRegistry('test', max_sessions=3, ttl=60, on_evict=lambda sid, value: evicted.append((sid, value)))
+
+    for sid in ("a", "b", "c"):
+        registry.get_or_create(sid, lambda sid=sid: f"state-{sid}")
+    check("get_or_create returns the existing entry", registry.get_or_create("a", lambda: "new") == "state-a")
+
+    # "a" was just used, so "b" is now the least recently used
+    registry.set("d", "state-d")
+    check("LRU entry is evicted past max_sessions",
+          "b" not in registry and len(registry) == 3 and evicted == [("b", "state-b")])
+
+    registry.get("c")
+    check("get() refreshes recency", list(registry._entries)[-1] == "c")
+    check("missing session returns the default", registry.get("zzz", "none") == "none")
+
+    # Idle entries: "a" and "d" untouched for longer than the TTL, "c" still in use
+    now = time.time()
+    for sid in ("a", "d"):
+        registry._entries[sid] = (registry._entries[sid][0], now - 120)
+    registry._entries.move_to_end("c")
+    dropped = registry.sweep(now)
+    check("sweep() drops entries idle past the TTL and keeps active ones",
+          dropped == 2 and list(registry._entries) == ["c"] and ("a", "state-a") in evicted)
+
+    check("pop() removes without the eviction callback",
+          registry.pop("c") == "state-c" and len(registry) == 0 and len(evicted) == 3)
+
+    stats = registry.stats()
+    check("stats count creations and both kinds of eviction",
+          (stats['created'], stats['evicted_lru'], stats['evicted_ttl'], stats['live_sessions']) == (4, 1, 2, 0))
+
+    # factory() runs outside the lock: a slow build doesn't hold up other
+    # sessions, and when two builds race for one session the first one stored wins
+    discarded = []
+    registry = SessionRegistry('test', max_sessions=8, ttl=60, on_evict=lambda sid, value: discarded.append((sid, value)))
+    building, finish = threading.Event(), threading.Event()
+
+    def slow_factory():
+        building.set()
+        finish.wait(5)
+        return "slow"
+
+    results = {}
+    slow = threading.Thread(target=lambda: results.update(slow=registry.get_or_create("a", slow_factory)))
+    slow.start()
+    building.wait(5)
+    other = threading.Thread(target=lambda: results.update(other=registry.get_or_create("b", lambda: "quick")))
+    other.start()
+    other.join(2)
+    check("A slow factory doesn't block other sessions", results.get("other") == "quick")
+
+    racer = registry.get_or_create("a", lambda: "fast")
+    finish.set()
+    slow.join(5)
+    check("Racing builds keep the first entry and hand the other to on_evict",
+          racer == results.get("slow") == registry.get("a") == "fast" and discarded == [("a", "slow")]
+          and registry.stats()['created'] == 2)
+
+    # Frames without a session_id get a throwaway tracker: one anonymous
+    # client mustn't push the classroom sessions out of the LRU
+    system = bare_system(max_sessions=1)
+    frame = np.zeros((120, 160, 3), np.uint8)
+    system.analyze_frame(frame, session_id="classroom-1")
+    for _ in range(5):
+        system.analyze_frame(frame)
+        system.analyze_frame(frame, session_id="")
+    stats = system.session_tracking.stats()
+    check("Frames without a session_id create and evict nothing",
+          "classroom-1" in system.session_tracking and stats['created'] == 1 and stats['evicted_lru'] == 0)
+
+    print()
+    if failures:
+        print(f"❌ {failures} check(s) failed")
+        sys.exit(1)
+    print("✅ Tracking prediction and session state behave")
+
+
+if __name__ == "__main__":
+    main()